@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Maintenance commands for the Gallinapp backend.
+
+    python manage.py backfill-rollups
+    python manage.py ensure-indexes
+    python manage.py assign-farm [FARM_ID]
+    python manage.py shard-collections
+    python manage.py archive
+    python manage.py rebuild-kpis
+"""
+import asyncio
+import json
+
+import typer
+
+import server
+
+cli = typer.Typer(help="Gallinapp maintenance commands", no_args_is_help=True)
+
+
+@cli.callback()
+def main():
+    """Gallinapp maintenance commands."""
+
+
+@cli.command("backfill-rollups")
+def backfill_rollups():
+    """Rebuild the egg and transaction rollup collections from history."""
+    counts = asyncio.run(server.rebuild_rollups())
+    typer.echo(json.dumps(counts))
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes():
+    """Create the indexes declared in server.INDEX_SPECS."""
+    asyncio.run(server.ensure_indexes())
+    typer.echo("ok")
+
+
+@cli.command("assign-farm")
+def assign_farm(farm_id: str = typer.Argument(server.DEFAULT_FARM_ID)):
+    """Assign documents without a farm to FARM_ID and rebuild the indexes by farm."""
+    counts = asyncio.run(server.assign_farm(farm_id))
+    typer.echo(json.dumps(counts))
+
+
+@cli.command("shard-collections")
+def shard_collections():
+    """Shard the farm collections on (farm_id, id); run against mongos."""
+    keys = asyncio.run(server.shard_collections())
+    typer.echo(json.dumps(keys))
+
+
+@cli.command("archive")
+def archive():
+    """Move closed months past ARCHIVE_HOT_MONTHS to the archive collections."""
+    moved = asyncio.run(server.archive_closed_months())
+    typer.echo(json.dumps({"archived": moved}))
+
+
+@cli.command("rebuild-kpis")
+def rebuild_kpis():
+    """Recompute the lot_kpis collection from animals, incubations and feed calculations."""
+    lots = asyncio.run(server.rebuild_kpis())
+    typer.echo(json.dumps({"lots": lots}))
+
+
+if __name__ == "__main__":
+    cli()
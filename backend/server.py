@@ -1,23 +1,305 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 import os
+import asyncio
+import base64
+import contextvars
+import csv
+import functools
+import hashlib
+import inspect
+import io
+import itertools
+import socket
+import json
 import logging
+import math
+import shutil
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+import typing
+from typing import Dict, List, Optional
 import uuid
-from datetime import datetime, date, time
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, date, time, timedelta, timezone
+from time import monotonic
+from urllib.parse import urlencode
+from calendar import monthrange
 from enum import Enum
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only needed for Parquet exports
+    pa = None
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Optional: only needed when CACHE_URL points at a Redis server
+    redis_asyncio = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+# Exported in Prometheus text format at /metrics. Routes are labelled by their
+# path template and Mongo commands by collection, so label sets stay bounded.
+REQUESTS = Counter("http_requests_total", "Peticiones HTTP", ["method", "route", "status"])
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Tamaño del cuerpo de las respuestas", ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+SERIALIZATION_LATENCY = Histogram(
+    "response_serialization_seconds", "Tiempo de codificación JSON de las respuestas",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "Duración de los comandos de MongoDB", ["command", "collection"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MONGO_DOCUMENTS = Counter(
+    "mongo_documents_returned_total", "Documentos devueltos por MongoDB", ["command", "collection"],
+)
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Comandos de MongoDB fallidos", ["command", "collection"])
+MONGO_POOL_OPEN = Gauge("mongo_pool_connections", "Conexiones abiertas del pool", ["address"])
+MONGO_POOL_IN_USE = Gauge("mongo_pool_connections_in_use", "Conexiones del pool en uso", ["address"])
+TELEMETRY_READINGS = Counter("telemetry_readings_total", "Lecturas de telemetría recibidas")
+TELEMETRY_BUFFERED = Gauge("telemetry_buffered_readings", "Lecturas de telemetría pendientes de escribir")
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Retraso del event loop sobre el intervalo esperado",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+EVENT_LOOP_LAG_INTERVAL = 0.5
+
+# Commands whose first argument is the collection name; everything else
+# (hello, ping, endSessions...) is left out of the collection metrics
+COLLECTION_COMMANDS = {
+    "find", "aggregate", "insert", "update", "delete", "findAndModify", "count", "distinct", "createIndexes",
+}
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        if event.command_name in COLLECTION_COMMANDS:
+            collection = event.command.get(event.command_name)
+        elif event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            return
+        if isinstance(collection, str):
+            self.pending[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        cursor = event.reply.get("cursor")
+        if cursor is not None:
+            returned = len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+        elif event.command_name in ("count", "distinct", "findAndModify"):
+            returned = 1 if event.reply.get("value", event.reply.get("n")) is not None else 0
+        else:
+            return
+        MONGO_DOCUMENTS.labels(event.command_name, collection).inc(returned)
+
+    def failed(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_FAILURES.labels(event.command_name, collection).inc()
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_OPEN.labels(f"{event.address[0]}:{event.address[1]}").inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_OPEN.labels(f"{event.address[0]}:{event.address[1]}").dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_IN_USE.labels(f"{event.address[0]}:{event.address[1]}").inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_IN_USE.labels(f"{event.address[0]}:{event.address[1]}").dec()
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware so streamed bodies (NDJSON,
+    # server-sent events) are counted as they are sent, not buffered
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = monotonic()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "sin_ruta"
+            method = scope["method"]
+            REQUESTS.labels(method, path, status).inc()
+            REQUEST_LATENCY.labels(method, path).observe(monotonic() - started)
+            RESPONSE_SIZE.labels(method, path).observe(size)
+
+async def measure_event_loop_lag():
+    while True:
+        started = monotonic()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        EVENT_LOOP_LAG.observe(max(0.0, monotonic() - started - EVENT_LOOP_LAG_INTERVAL))
+
 # MongoDB connection
+# Pool, timeout and compression settings come from the environment; unset
+# values keep the driver defaults. Writes and request-path reads use `db` on the
+# primary. Dashboard and analytics reads use `analytics_db`, which also reads
+# the primary unless MONGO_ANALYTICS_READ_PREFERENCE says otherwise. ETags and
+# cache invalidation follow the version counters on the primary, so routes that
+# read `analytics_db` are neither cached nor ETagged when it may lag behind.
+MONGO_INT_SETTINGS = {
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+    "socketTimeoutMS": "MONGO_SOCKET_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+}
+READ_PREFERENCES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def read_preference(name, max_staleness=-1):
+    if name == "primary":
+        return Primary()
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    return READ_PREFERENCES[name](max_staleness=max_staleness)
+
+def mongo_client_options():
+    options = {
+        option: int(os.environ[variable])
+        for option, variable in MONGO_INT_SETTINGS.items() if os.environ.get(variable)
+    }
+    if os.environ.get("MONGO_COMPRESSORS"):
+        options["compressors"] = os.environ["MONGO_COMPRESSORS"]
+    options["read_preference"] = read_preference(os.environ.get("MONGO_READ_PREFERENCE", "primary"))
+    return options
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url, event_listeners=[CommandMetrics(), PoolMetrics()], **mongo_client_options()
+)
 db = client[os.environ['DB_NAME']]
+ANALYTICS_READ_PREFERENCE = os.environ.get("MONGO_ANALYTICS_READ_PREFERENCE", "primary")
+analytics_db = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=read_preference(
+        ANALYTICS_READ_PREFERENCE,
+        int(os.environ.get("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", "-1")),
+    ),
+)
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get("MONGO_WARMUP_CONNECTIONS", os.environ.get("MONGO_MIN_POOL_SIZE") or "4"))
+
+async def warm_up_connections():
+    """Open connections to the primary and the analytics members before serving requests."""
+    # Concurrent pings each check out their own connection
+    await asyncio.gather(
+        *(db.command("ping") for _ in range(MONGO_WARMUP_CONNECTIONS)),
+        *(analytics_db.command("ping", read_preference=analytics_db.read_preference)
+          for _ in range(MONGO_WARMUP_CONNECTIONS)),
+    )
+
+DASHBOARD_CHANGE_STREAM = os.environ.get("DASHBOARD_CHANGE_STREAM", "0") == "1"
+
+# Farms
+# Several farms share one deployment. Every document carries the farm_id of
+# its farm and every query, index and cache entry is scoped by it, farm_id
+# first. A request selects its farm with the X-Farm-Id header (DEFAULT_FARM_ID
+# when absent); resolve_farm() stores it in a context variable so the helpers
+# under the routes scope their queries without passing it along every call.
+DEFAULT_FARM_ID = os.environ.get("DEFAULT_FARM_ID", "principal")
+FARM_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+farm_context = contextvars.ContextVar("farm_id", default=DEFAULT_FARM_ID)
+
+def current_farm():
+    return farm_context.get()
+
+def farm_query(query=None):
+    return {"farm_id": current_farm(), **(query or {})}
+
+def farm_scoped(name):
+    return f"{current_farm()}:{name}"
+
+@contextmanager
+def farm_scope(farm_id):
+    """Run code outside a request (jobs, maintenance) as `farm_id`."""
+    token = farm_context.set(farm_id)
+    try:
+        yield
+    finally:
+        farm_context.reset(token)
+
+async def resolve_farm(
+    farm_id: str = Header(DEFAULT_FARM_ID, alias="X-Farm-Id", pattern=FARM_ID_PATTERN),
+):
+    farm_context.set(farm_id)
 
 # Helper function to convert date to datetime for MongoDB compatibility
 def date_to_datetime(d):
@@ -25,11 +307,189 @@ def date_to_datetime(d):
         return datetime.combine(d, time())
     return d
 
+# Fast-path serialization
+# Documents in MongoDB are written by this app from validated models, so read
+# paths project the model's fields (without `_id`) and encode the raw documents
+# straight to JSON bytes instead of building a model per document and letting
+# FastAPI validate and serialize it again through response_model.
+def model_projection(model):
+    projection = {field: 1 for field in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_response(content, response=None):
+    # Headers set on the injected Response (ETag, X-Next-Cursor) are only
+    # applied by FastAPI when the handler does not return a Response itself
+    headers = dict(response.headers) if response is not None else None
+    with SERIALIZATION_LATENCY.time():
+        body = dumps(content)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Pagination helpers
+# List endpoints are ordered newest first by (<date field>, id) and paginated by
+# keyset: the cursor encodes the last returned pair, so each page is a bounded
+# index range scan instead of a skip over everything already seen.
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 500
+
+def encode_cursor(doc, sort_field, direction=-1):
+    payload = json.dumps([doc[sort_field].isoformat(), doc["id"], direction])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, direction=-1):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, doc_id, *cursor_direction = json.loads(payload)
+        decoded = datetime.fromisoformat(value), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if (cursor_direction or [-1])[0] != direction:
+        raise HTTPException(status_code=400, detail="El cursor corresponde a otro orden")
+    return decoded
+
+def keyset_query(sort_field, after, query=None, direction=-1):
+    query = dict(query or {})
+    if after:
+        value, doc_id = decode_cursor(after, direction)
+        past = "$lt" if direction < 0 else "$gt"
+        query["$or"] = [
+            {sort_field: {past: value}},
+            {sort_field: value, "id": {past: doc_id}},
+        ]
+    return query
+
+def date_range_query(date_field, desde, hasta):
+    """Match `desde` <= date_field < the day after `hasta`; both bounds optional."""
+    if desde and hasta and desde > hasta:
+        raise HTTPException(status_code=400, detail="`desde` debe ser anterior a `hasta`")
+    bounds = {}
+    if desde:
+        bounds["$gte"] = date_to_datetime(desde)
+    if hasta:
+        bounds["$lt"] = date_to_datetime(hasta + timedelta(days=1))
+    return {date_field: bounds} if bounds else {}
+
+# List filters
+# The list routes share one set of query parameters, declared per collection
+# with list_filters(): a date range on the collection's date field, equality
+# filters (repeat a parameter to match any of several values), `campos` to
+# project only some fields and `orden` for the direction. They translate to a
+# plain Mongo filter, scoped to the request's farm, whose equality fields lead
+# and whose date range and sort follow, the shape of the compound indexes in
+# INDEX_SPECS.
+class ListFilters:
+    def __init__(self, date_field, query, projection, direction, key):
+        self.date_field = date_field
+        self.query = query
+        self.projection = projection
+        self.direction = direction
+        self.key = key
+
+    def __str__(self):
+        # Part of the read-cache key (see cache_key())
+        return self.key
+
+def list_filters(model, date_field, **filters):
+    """Build the FastAPI dependency parsing the list parameters of `model`.
+
+    `filters` maps each filterable field to its type (an Enum or str).
+    """
+    keyword = inspect.Parameter.KEYWORD_ONLY
+    parameters = [
+        inspect.Parameter("desde", keyword, annotation=Optional[date],
+                          default=Query(None, description=f"{date_field} desde esta fecha, incluida")),
+        inspect.Parameter("hasta", keyword, annotation=Optional[date],
+                          default=Query(None, description=f"{date_field} hasta esta fecha, incluida")),
+        *(
+            inspect.Parameter(field, keyword, annotation=Optional[List[kind]],
+                              default=Query(None, description="Repetir para aceptar varios valores"))
+            for field, kind in filters.items()
+        ),
+        inspect.Parameter("campos", keyword, annotation=Optional[str],
+                          default=Query(None, description="Campos a devolver, separados por comas")),
+        inspect.Parameter("orden", keyword, annotation=SortOrder, default=Query(SortOrder.DESC)),
+    ]
+
+    def dependency(**params):
+        query = farm_query()
+        for field in filters:
+            values = [value.value if isinstance(value, Enum) else value for value in params[field] or []]
+            if values:
+                query[field] = values[0] if len(values) == 1 else {"$in": values}
+        # Equality filters first, then the range on the sort field
+        query.update(date_range_query(date_field, params["desde"], params["hasta"]))
+
+        projection = model_projection(model)
+        if params["campos"]:
+            campos = {campo.strip() for campo in params["campos"].split(",") if campo.strip()}
+            unknown = sorted(campos - set(model.model_fields))
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(unknown)}")
+            # The cursor of the next page needs the sort key
+            projection = {campo: 1 for campo in sorted(campos | {"id", date_field})}
+            projection["_id"] = 0
+
+        key = urlencode(sorted(
+            (name, str(value.value if isinstance(value, Enum) else value))
+            for name, values in params.items() if values is not None
+            for value in (values if isinstance(values, list) else [values])
+        ))
+        direction = -1 if params["orden"] == SortOrder.DESC else 1
+        return ListFilters(date_field, query, projection, direction, key)
+
+    dependency.__signature__ = inspect.Signature(parameters)
+    return dependency
+
+async def stream_ndjson(cursor):
+    async for doc in cursor:
+        yield dumps(doc) + b"\n"
+
+async def list_documents(collection, filters, response, limit, after, stream):
+    """Return one keyset page of `collection` matching `filters`, or stream all of it as NDJSON.
+
+    When more documents remain, the cursor for the next page is sent in the
+    `X-Next-Cursor` response header so the body stays a plain list.
+    """
+    sort_field, direction = filters.date_field, filters.direction
+    query = keyset_query(sort_field, after, filters.query, direction)
+    sort = [(sort_field, direction), ("id", direction)]
+    if stream:
+        cursor = tiered_find(collection.name, sort_field, query, filters.projection, sort, batch_size=STREAM_BATCH_SIZE)
+        return StreamingResponse(
+            stream_ndjson(cursor), media_type="application/x-ndjson", headers=dict(response.headers)
+        )
+
+    cursor = tiered_find(collection.name, sort_field, query, filters.projection, sort, limit=limit + 1)
+    docs = await cursor.to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1], sort_field, direction)
+    return json_response(docs, response)
+
+@asynccontextmanager
+async def lifespan(app):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
 # Create the main app without a prefix
-app = FastAPI(title="Gallinapp API", description="Sistema de gestión avícola integral")
+app = FastAPI(title="Gallinapp API", description="Sistema de gestión avícola integral", lifespan=lifespan)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", dependencies=[Depends(resolve_farm)])
 
 # Enums
 class AnimalType(str, Enum):
@@ -57,17 +517,65 @@ class TransactionType(str, Enum):
     INGRESO = "ingreso"
     EGRESO = "egreso"
 
+class TelemetryResolution(str, Enum):
+    CRUDA = "crudo"
+    MINUTO = "1m"
+    HORA = "1h"
+
+class TelemetryVariable(str, Enum):
+    TEMPERATURA = "temperatura"
+    HUMEDAD = "humedad"
+
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+class AnalyticsGranularity(str, Enum):
+    DIA = "dia"
+    SEMANA = "semana"
+    MES = "mes"
+
+class ExportCollection(str, Enum):
+    ANIMALS = "animals"
+    INCUBATION_BATCHES = "incubation_batches"
+    EGG_COLLECTIONS = "egg_collections"
+    FEED_CALCULATIONS = "feed_calculations"
+    TRANSACTIONS = "transactions"
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+
+class SyncOperation(str, Enum):
+    CREAR_ANIMAL = "crear_animal"
+    ACTUALIZAR_ANIMAL = "actualizar_animal"
+    CREAR_INCUBACION = "crear_incubacion"
+    ACTUALIZAR_INCUBACION = "actualizar_incubacion"
+    CREAR_RECOLECCION = "crear_recoleccion"
+    CREAR_TRANSACCION = "crear_transaccion"
+
+class SyncStatus(str, Enum):
+    APLICADA = "aplicada"
+    DUPLICADA = "duplicada"
+    OBSOLETA = "obsoleta"  # el registro cambió después de fecha_cliente
+    ERROR = "error"
+
 # Models
 class Animal(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    farm_id: str = Field(default_factory=current_farm)
     lote: str
     tipo: AnimalType
     raza: str
     cantidad: int
     fecha_ingreso: datetime
     edad_dias: int
+    edad_ingreso_dias: Optional[int] = None  # edad al ingresar; edad_dias avanza desde fecha_ingreso
     peso_promedio: float
     estado: AnimalStatus = AnimalStatus.ACTIVO
+    bajas: int = 0  # aves muertas desde el ingreso
+    vendidos: int = 0
+    transferidos: int = 0
     observaciones: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -88,8 +596,24 @@ class AnimalUpdate(BaseModel):
     estado: Optional[AnimalStatus] = None
     observaciones: Optional[str] = None
 
+class AnimalMortality(BaseModel):
+    cantidad: int = Field(gt=0)
+
+class AnimalSale(BaseModel):
+    cantidad: int = Field(gt=0)
+    precio_unitario: float = Field(ge=0)
+    fecha: Optional[date] = None  # por defecto, hoy
+    concepto: str = "Venta de animales"
+    categoria: str = "Ventas"
+    observaciones: Optional[str] = None
+
+class AnimalTransfer(BaseModel):
+    cantidad: int = Field(gt=0)
+    lote_destino: str = Field(min_length=1)
+
 class IncubationBatch(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    farm_id: str = Field(default_factory=current_farm)
     lote: str
     tipo_huevo: AnimalType  # ponedora o engorde
     raza: str
@@ -122,8 +646,47 @@ class IncubationUpdate(BaseModel):
     pollitos_eclosionados: Optional[int] = None
     observaciones: Optional[str] = None
 
+TELEMETRY_MAX_READINGS = 5000
+
+class TelemetryReading(BaseModel):
+    ts: datetime
+    temperatura: float
+    humedad: float
+
+class TelemetryIngest(BaseModel):
+    lecturas: List[TelemetryReading] = Field(min_length=1, max_length=TELEMETRY_MAX_READINGS)
+
+class TelemetryPoint(BaseModel):
+    periodo: datetime
+    lecturas: int
+    temperatura_promedio: float
+    temperatura_min: float
+    temperatura_max: float
+    humedad_promedio: float
+    humedad_min: float
+    humedad_max: float
+
+class IncubationAlert(BaseModel):
+    id: str
+    batch_id: str
+    variable: TelemetryVariable
+    minimo_permitido: float
+    maximo_permitido: float
+    valor_minimo: float  # de las lecturas fuera de rango
+    valor_maximo: float
+    ultimo_valor: float
+    lecturas: int  # lecturas fuera de rango
+    abierta: bool
+    desde: datetime
+    hasta: Optional[datetime] = None  # primera lectura de nuevo en rango
+
+class TelemetryIngestResult(BaseModel):
+    aceptadas: int
+    alertas: List[IncubationAlert] = []
+
 class EggCollection(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    farm_id: str = Field(default_factory=current_farm)
     fecha: datetime
     lote_origen: str
     tipo: EggType
@@ -142,6 +705,7 @@ class EggCollectionCreate(BaseModel):
 
 class FeedCalculation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    farm_id: str = Field(default_factory=current_farm)
     lote: str
     tipo_animal: AnimalType
     cantidad_animales: int
@@ -163,8 +727,43 @@ class FeedCalculationCreate(BaseModel):
     precio_alimento_kg: float
     observaciones: Optional[str] = None
 
+class FeedBand(BaseModel):
+    edad_desde: int = Field(ge=0)
+    consumo_kg: float = Field(ge=0)  # por ave y día
+
+class FeedPlanLot(BaseModel):
+    lote: str
+    tipo_animal: AnimalType
+    cantidad_animales: int = Field(ge=0)
+    edad_dias: int = Field(ge=0)
+
+class FeedPlanRequest(BaseModel):
+    lotes: Optional[List[FeedPlanLot]] = None  # None: todos los lotes activos
+    horizonte_dias: int = Field(30, ge=1, le=3650)
+    precio_alimento_kg: float = Field(ge=0)
+    tabla_consumo: Optional[Dict[AnimalType, List[FeedBand]]] = None
+    detalle_diario: bool = False
+
+class FeedPlanLotResult(BaseModel):
+    lote: str
+    tipo_animal: AnimalType
+    cantidad_animales: int
+    edad_dias: int
+    consumo_total_kg: float
+    costo_total: float
+    consumo_diario_kg: Optional[List[float]] = None
+
+class FeedPlan(BaseModel):
+    horizonte_dias: int
+    precio_alimento_kg: float
+    consumo_total_kg: float
+    costo_total: float
+    consumo_diario_granja_kg: List[float]
+    lotes: List[FeedPlanLotResult]
+
 class Transaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    farm_id: str = Field(default_factory=current_farm)
     fecha: datetime
     tipo: TransactionType
     concepto: str
@@ -173,9 +772,18 @@ class Transaction(BaseModel):
     unidad: Optional[str] = None
     precio_unitario: float
     total: float
+    lote: Optional[str] = None
     observaciones: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class AnimalSaleResult(BaseModel):
+    animal: Animal
+    transaccion: Transaction
+
+class AnimalTransferResult(BaseModel):
+    origen: Animal
+    destino: Animal
+
 class TransactionCreate(BaseModel):
     fecha: date
     tipo: TransactionType
@@ -185,8 +793,104 @@ class TransactionCreate(BaseModel):
     unidad: Optional[str] = None
     precio_unitario: float
     total: float
+    lote: Optional[str] = None
     observaciones: Optional[str] = None
 
+class BulkItemError(BaseModel):
+    indice: int
+    detalle: str
+
+class BulkResult(BaseModel):
+    insertados: int = 0
+    errores: List[BulkItemError] = []
+
+SYNC_MAX_MUTATIONS = 1000
+
+class SyncMutation(BaseModel):
+    id_cliente: str = Field(min_length=1, max_length=255)  # clave de idempotencia generada en el dispositivo
+    operacion: SyncOperation
+    fecha_cliente: datetime
+    objetivo_id: Optional[str] = None  # id del registro para las actualizaciones
+    datos: dict
+
+class SyncRequest(BaseModel):
+    mutaciones: List[SyncMutation] = Field(max_length=SYNC_MAX_MUTATIONS)
+
+class SyncOutcome(BaseModel):
+    id_cliente: str
+    estado: SyncStatus
+    detalle: Optional[str] = None
+    resultado: Optional[dict] = None
+
+class EggAnalyticsPoint(BaseModel):
+    periodo: datetime
+    lote_origen: str
+    tipo: EggType
+    cantidad: int
+    peso_total: float
+    registros: int
+    peso_promedio_huevo: Optional[float] = None
+    gallinas: Optional[int] = None
+    huevos_por_gallina_dia: Optional[float] = None
+    cerrado: bool
+
+class LotEggTotals(BaseModel):
+    cantidad: int = 0
+    peso_total: float = 0.0
+
+class LotFeedSummary(BaseModel):
+    calculos: int = 0
+    ultimo_calculo: Optional[FeedCalculation] = None
+
+class LotTransactionSummary(BaseModel):
+    total_ingresos: float = 0.0
+    total_egresos: float = 0.0
+    ultimas: List[Transaction] = []
+
+class LotSummary(BaseModel):
+    lote: str
+    total_aves: int
+    animales: List[Animal]
+    huevos: LotEggTotals
+    alimento: LotFeedSummary
+    incubaciones: List[IncubationBatch]
+    transacciones: LotTransactionSummary
+
+class SearchHit(BaseModel):
+    coleccion: str
+    score: float
+    documento: dict
+
+class LotKpis(BaseModel):
+    lote: str
+    raza: Optional[str] = None  # raza con más aves del lote
+    huevos_incubados: int = 0  # de las incubaciones con resultado
+    pollitos_eclosionados: int = 0
+    tasa_eclosion: Optional[float] = None  # pollitos_eclosionados / huevos_incubados
+    aves_iniciales: int = 0  # aves actuales + bajas + vendidos + transferidos
+    bajas: int = 0
+    mortalidad: Optional[float] = None  # bajas / aves_iniciales
+    conversion_alimenticia: Optional[float] = None  # kg de alimento por kg de peso vivo, último cálculo
+    updated_at: datetime
+
+class KpiStats(BaseModel):
+    valor: Optional[float] = None  # de la raza en conjunto
+    p25: Optional[float] = None  # entre los lotes de la raza
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    percentil: Optional[float] = None  # posición de `valor` entre las razas (100 = el más alto)
+
+class BreedKpis(BaseModel):
+    raza: str
+    lotes: int
+    tasa_eclosion: KpiStats
+    mortalidad: KpiStats
+    conversion_alimenticia: KpiStats
+
+class KpiReport(BaseModel):
+    lotes: List[LotKpis]
+    razas: List[BreedKpis]
+
 class Dashboard(BaseModel):
     total_animales: int
     total_ponedoras: int
@@ -199,123 +903,1541 @@ class Dashboard(BaseModel):
     ultimas_recolecciones: List[EggCollection]
     lotes_proximos_venta: List[Animal]
 
+# Indexes
+# Declared next to the query shapes they serve; created idempotently at startup.
+# Every shape in QUERY_SHAPES must be answerable by one of these indexes, which
+# /api/admin/indexes/explain verifies against the live query planner.
+# Indexes on farm data lead with farm_id, which every query on it matches.
+def by_farm(*fields, **options):
+    return IndexModel([("farm_id", ASCENDING), *((name, ASCENDING) for name in fields)], **options)
+
+def newest_first(field, *equality):
+    # Equality-filtered fields lead so a filtered page is still one range scan
+    return IndexModel([
+        ("farm_id", ASCENDING), *((name, ASCENDING) for name in equality), (field, DESCENDING), ("id", DESCENDING),
+    ])
+
+def text_search(*fields):
+    # MongoDB allows a single text index per collection; the farm_id prefix
+    # requires an equality match on it in every $text query
+    return IndexModel(
+        [("farm_id", ASCENDING), *((field, TEXT) for field in fields)],
+        name="busqueda_texto", default_language="spanish",
+    )
+
+# Stored responses of requests sent with an Idempotency-Key (see idempotent())
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(7 * 24 * 3600)))
+# A claim not completed or released within this time belongs to a dead worker
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", "120"))
+ARCHIVE_COMPRESSOR = os.environ.get("ARCHIVE_COMPRESSOR", "zstd")
+TELEMETRY_RAW_TTL_SECONDS = int(os.environ.get("TELEMETRY_RAW_TTL_SECONDS", str(14 * 24 * 3600)))
+TELEMETRY_MINUTE_TTL_SECONDS = int(os.environ.get("TELEMETRY_MINUTE_TTL_SECONDS", str(90 * 24 * 3600)))
+
+# Collections that take options at creation, created before their indexes
+COLLECTION_OPTIONS = {
+    **{
+        archive: {"storageEngine": {"wiredTiger": {"configString": f"block_compressor={ARCHIVE_COMPRESSOR}"}}}
+        for archive in ("egg_collections_archive", "transactions_archive")
+    },
+    "incubation_telemetry": {
+        "timeseries": {"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+        "expireAfterSeconds": TELEMETRY_RAW_TTL_SECONDS,
+    },
+}
+
+INDEX_SPECS = {
+    "animals": [
+        by_farm("id", unique=True),
+        newest_first("fecha_ingreso"),
+        newest_first("fecha_ingreso", "estado"),
+        by_farm("estado", "tipo", "edad_dias"),
+        by_farm("lote", "tipo", "estado"),
+        text_search("lote", "raza", "observaciones"),
+    ],
+    "incubation_batches": [
+        by_farm("id", unique=True),
+        newest_first("fecha_incubacion"),
+        newest_first("fecha_incubacion", "estado"),
+        by_farm("estado", "fecha_eclosion_esperada"),
+        by_farm("lote"),
+        text_search("lote", "raza", "observaciones"),
+    ],
+    "egg_collections": [
+        by_farm("id", unique=True),
+        newest_first("fecha"),
+        newest_first("fecha", "lote_origen"),
+        text_search("lote_origen", "observaciones"),
+    ],
+    "feed_calculations": [
+        by_farm("id", unique=True),
+        newest_first("fecha_calculo"),
+        newest_first("fecha_calculo", "lote"),
+    ],
+    "transactions": [
+        by_farm("id", unique=True),
+        newest_first("fecha"),
+        newest_first("fecha", "lote"),
+        newest_first("fecha", "categoria"),
+        text_search("concepto", "categoria", "observaciones"),
+    ],
+    "egg_daily_rollups": [
+        by_farm("fecha", "lote_origen", "tipo", unique=True),
+        by_farm("lote_origen"),
+    ],
+    "transaction_monthly_rollups": [
+        by_farm("mes", "tipo", "categoria", unique=True),
+    ],
+    "egg_analytics_buckets": [
+        by_farm("granularidad", "periodo", unique=True),
+    ],
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ],
+    # Archive tier (see archive_closed_months()): only what list, export and
+    # lot reads need, so the cold indexes stay small as well
+    "egg_collections_archive": [
+        by_farm("id", unique=True),
+        newest_first("fecha"),
+        newest_first("fecha", "lote_origen"),
+    ],
+    "transactions_archive": [
+        by_farm("id", unique=True),
+        newest_first("fecha"),
+        newest_first("fecha", "lote"),
+    ],
+    "incubation_telemetry": [
+        IndexModel([("meta.farm_id", ASCENDING), ("meta.batch_id", ASCENDING), ("ts", ASCENDING)]),
+    ],
+    "incubation_telemetry_1m": [
+        by_farm("batch_id", "periodo", unique=True),
+        IndexModel([("periodo", ASCENDING)], expireAfterSeconds=TELEMETRY_MINUTE_TTL_SECONDS),
+    ],
+    "incubation_telemetry_1h": [
+        by_farm("batch_id", "periodo", unique=True),
+    ],
+    "lot_kpis": [
+        by_farm("lote", unique=True),
+    ],
+    "incubation_alerts": [
+        # At most one open alert per batch and variable
+        by_farm("batch_id", "variable", unique=True, partialFilterExpression={"abierta": True}),
+        newest_first("desde", "abierta"),
+    ],
+}
+
+# name -> (collection, filter, sort) for every query server.py issues, before
+# the farm_id match that farm_query() adds to all of them
+_sample_date = datetime(2024, 1, 1)
+QUERY_SHAPES = {
+    "animal_by_id": ("animals", {"id": "x"}, None),
+    "animals_page": ("animals", {}, [("fecha_ingreso", -1), ("id", -1)]),
+    "animals_page_estado": (
+        "animals", {"estado": "activo", "fecha_ingreso": {"$gte": _sample_date}}, [("fecha_ingreso", -1), ("id", -1)],
+    ),
+    "dashboard_animals_activos": ("animals", {"estado": "activo"}, None),
+    "dashboard_animals_por_tipo": ("animals", {"tipo": "ponedora", "estado": "activo"}, None),
+    "dashboard_proximos_venta": ("animals", {"tipo": "engorde", "edad_dias": {"$gte": 35}, "estado": "activo"}, None),
+    "incubation_by_id": ("incubation_batches", {"id": "x"}, None),
+    "incubation_page": ("incubation_batches", {}, [("fecha_incubacion", -1), ("id", -1)]),
+    "incubation_page_estado": ("incubation_batches", {"estado": "activo"}, [("fecha_incubacion", -1), ("id", -1)]),
+    "incubaciones_activas": ("incubation_batches", {"estado": "activo"}, None),
+    "exportacion_recolecciones": (
+        "egg_collections", {"fecha": {"$gte": _sample_date, "$lt": _sample_date}}, [("fecha", 1), ("id", 1)],
+    ),
+    "exportacion_transacciones": (
+        "transactions", {"fecha": {"$gte": _sample_date, "$lt": _sample_date}}, [("fecha", 1), ("id", 1)],
+    ),
+    "incubaciones_vencidas": (
+        "incubation_batches", {"estado": "activo", "fecha_eclosion_esperada": {"$lt": _sample_date}}, None,
+    ),
+    "egg_collections_page": ("egg_collections", {}, [("fecha", -1), ("id", -1)]),
+    "egg_collections_page_rango": (
+        "egg_collections", {"fecha": {"$gte": _sample_date, "$lt": _sample_date}}, [("fecha", 1), ("id", 1)],
+    ),
+    "egg_collections_page_lote": (
+        "egg_collections", {"lote_origen": "x", "fecha": {"$gte": _sample_date}}, [("fecha", -1), ("id", -1)],
+    ),
+    "egg_collections_today": ("egg_collections", {"fecha": _sample_date}, None),
+    "ultimas_recolecciones": ("egg_collections", {}, [("fecha", -1)]),
+    "feed_calculations_page": ("feed_calculations", {}, [("fecha_calculo", -1), ("id", -1)]),
+    "transactions_page": ("transactions", {}, [("fecha", -1), ("id", -1)]),
+    "transactions_page_categoria": (
+        "transactions", {"categoria": "x", "fecha": {"$gte": _sample_date}}, [("fecha", -1), ("id", -1)],
+    ),
+    "egg_rollups_month": ("egg_daily_rollups", {"fecha": {"$gte": _sample_date, "$lte": _sample_date}}, None),
+    "egg_rollup_upsert": ("egg_daily_rollups", {"fecha": _sample_date, "lote_origen": "x", "tipo": "comercial"}, None),
+    "transaction_rollups_month": ("transaction_monthly_rollups", {"mes": _sample_date}, None),
+    "search_animals": ("animals", {"$text": {"$search": "x"}}, None),
+    "search_incubation_batches": ("incubation_batches", {"$text": {"$search": "x"}}, None),
+    "search_egg_collections": ("egg_collections", {"$text": {"$search": "x"}}, None),
+    "search_transactions": ("transactions", {"$text": {"$search": "x"}}, None),
+    "lot_animals": ("animals", {"lote": "x"}, None),
+    "lot_list": ("animals", {"lote": {"$gt": "x"}}, [("lote", 1)]),
+    "lot_egg_rollups": ("egg_daily_rollups", {"lote_origen": "x"}, None),
+    "lot_feed_calculations": ("feed_calculations", {"lote": "x"}, [("fecha_calculo", -1)]),
+    "lot_incubation_batches": ("incubation_batches", {"lote": "x"}, None),
+    "lot_transactions": ("transactions", {"lote": "x"}, [("fecha", -1)]),
+    "analytics_ponedoras_por_lote": ("animals", {"lote": {"$in": ["x"]}, "tipo": "ponedora", "estado": "activo"}, None),
+    "analytics_cached_buckets": (
+        "egg_analytics_buckets", {"granularidad": "mes", "periodo": {"$gte": _sample_date, "$lt": _sample_date}}, None,
+    ),
+    "transaction_rollup_upsert": (
+        "transaction_monthly_rollups", {"mes": _sample_date, "tipo": "ingreso", "categoria": "x"}, None,
+    ),
+    "archivo_recolecciones_page": ("egg_collections_archive", {}, [("fecha", -1), ("id", -1)]),
+    "archivo_transacciones_page": ("transactions_archive", {}, [("fecha", -1), ("id", -1)]),
+    "archivo_transacciones_lote": ("transactions_archive", {"lote": {"$in": ["x"]}}, None),
+    "archivo_mes_pendiente": ("egg_collections", {"fecha": {"$lt": _sample_date}}, None),
+    "telemetria_minutos": (
+        "incubation_telemetry_1m", {"batch_id": "x", "periodo": {"$gte": _sample_date, "$lte": _sample_date}},
+        [("periodo", 1)],
+    ),
+    "telemetria_horas": (
+        "incubation_telemetry_1h", {"batch_id": "x", "periodo": {"$gte": _sample_date, "$lte": _sample_date}},
+        [("periodo", 1)],
+    ),
+    "alerta_abierta": ("incubation_alerts", {"batch_id": "x", "variable": "temperatura", "abierta": True}, None),
+    "alertas_page": ("incubation_alerts", {"abierta": True}, [("desde", -1), ("id", -1)]),
+    "kpis_lote": ("lot_kpis", {"lote": "x"}, None),
+    "kpis_granja": ("lot_kpis", {}, [("lote", 1)]),
+}
+
+async def ensure_collections():
+    existing = set(await db.list_collection_names())
+    for collection, options in COLLECTION_OPTIONS.items():
+        if collection in existing:
+            continue
+        try:
+            await db.create_collection(collection, **options)
+        except CollectionInvalid:
+            pass  # created by another worker meanwhile
+        except OperationFailure as e:
+            # e.g. a storage engine without block compression or a server
+            # without time-series support; writes then create it plainly
+            logger.error("Could not create %s: %s", collection, e)
+
+async def ensure_indexes():
+    await ensure_collections()
+    for collection, indexes in INDEX_SPECS.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # Keep serving; explain_query_shapes will report the missing index
+            logger.error("Could not create indexes on %s: %s", collection, e)
+
+def plan_stages(plan):
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage"), *plan.get("inputStages", [])]:
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+async def explain_query_shapes():
+    report = {}
+    for name, (collection, query, sort) in QUERY_SHAPES.items():
+        cursor = db[collection].find({"farm_id": DEFAULT_FARM_ID, **query})
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation["queryPlanner"]["winningPlan"]
+        # Slot-based engine plans nest the classic tree under "queryPlan"
+        stages = [stage for stage in plan_stages(winning_plan.get("queryPlan", winning_plan)) if stage]
+        report[name] = {
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        }
+    return report
+
+# Farm partitioning
+# Deployments that predate farms are migrated once with assign_farm(), which
+# tags every document with a farm and replaces the indexes that do not lead
+# with farm_id. On a sharded cluster, shard_collections() distributes the raw
+# collections by (farm_id, id): a farm's documents stay together and every
+# single-document write, which filters on both, is routed to one shard.
+FARM_COLLECTIONS = (
+    "animals", "incubation_batches", "egg_collections", "feed_calculations", "transactions",
+    "egg_daily_rollups", "transaction_monthly_rollups", "egg_analytics_buckets",
+)
+SHARDED_COLLECTIONS = ("animals", "incubation_batches", "egg_collections", "feed_calculations", "transactions")
+SHARD_KEY = {"farm_id": 1, "id": 1}
+
+async def assign_farm(farm_id=DEFAULT_FARM_ID):
+    counts = {}
+    for collection in FARM_COLLECTIONS:
+        result = await db[collection].update_many({"farm_id": {"$exists": False}}, {"$set": {"farm_id": farm_id}})
+        counts[collection] = result.modified_count
+        for name, info in (await db[collection].index_information()).items():
+            if name != "_id_" and info["key"][0][0] != "farm_id":
+                await db[collection].drop_index(name)
+    # Versions counted before farms existed are keyed by collection alone
+    await db.collection_versions.delete_many({"farm_id": {"$exists": False}})
+    await ensure_indexes()
+    return counts
+
+async def shard_collections():
+    """Shard the raw collections on SHARD_KEY; requires a connection through mongos."""
+    await client.admin.command("enableSharding", db.name)
+    for collection in SHARDED_COLLECTIONS:
+        await client.admin.command("shardCollection", f"{db.name}.{collection}", key=SHARD_KEY)
+    return {collection: SHARD_KEY for collection in SHARDED_COLLECTIONS}
+
+# Rollups
+# Pre-aggregated totals maintained on every write so dashboard and balance
+# reads touch a handful of small documents instead of scanning raw history:
+#   egg_daily_rollups: eggs per (fecha, lote_origen, tipo)
+#   transaction_monthly_rollups: totals per (mes, tipo, categoria)
+async def apply_egg_rollups(collections):
+    totals = {}
+    for col in collections:
+        key = (col["farm_id"], col["fecha"], col["lote_origen"], col["tipo"])
+        cantidad, peso_total, registros = totals.get(key, (0, 0.0, 0))
+        totals[key] = (cantidad + col["cantidad"], peso_total + col["peso_total"], registros + 1)
+    if not totals:
+        return
+    await db.egg_daily_rollups.bulk_write([
+        UpdateOne(
+            {"farm_id": farm_id, "fecha": fecha, "lote_origen": lote_origen, "tipo": tipo},
+            {"$inc": {"cantidad": cantidad, "peso_total": peso_total, "registros": registros}},
+            upsert=True,
+        )
+        for (farm_id, fecha, lote_origen, tipo), (cantidad, peso_total, registros) in totals.items()
+    ], ordered=False)
+    await invalidate_egg_analytics({fecha for _, fecha, _, _ in totals})
+
+async def apply_transaction_rollups(transactions, session=None):
+    totals = {}
+    for tx in transactions:
+        key = (tx["farm_id"], tx["fecha"].replace(day=1), tx["tipo"], tx["categoria"])
+        total, registros = totals.get(key, (0.0, 0))
+        totals[key] = (total + tx["total"], registros + 1)
+    if not totals:
+        return
+    await db.transaction_monthly_rollups.bulk_write([
+        UpdateOne(
+            {"farm_id": farm_id, "mes": mes, "tipo": tipo, "categoria": categoria},
+            {"$inc": {"total": total, "registros": registros}},
+            upsert=True,
+        )
+        for (farm_id, mes, tipo, categoria), (total, registros) in totals.items()
+    ], ordered=False, session=session)
+
+async def rebuild_rollups():
+    """Recompute both rollup collections from the raw history, hot and archived.
+
+    $out swaps the target atomically and keeps its indexes; writes that land
+    while the rebuild runs are not reflected, so run it with writers paused.
+    """
+    await db.egg_collections.aggregate([
+        {"$unionWith": ARCHIVES["egg_collections"][0]},
+        {"$group": {
+            "_id": {"farm_id": "$farm_id", "fecha": "$fecha", "lote_origen": "$lote_origen", "tipo": "$tipo"},
+            "cantidad": {"$sum": "$cantidad"},
+            "peso_total": {"$sum": "$peso_total"},
+            "registros": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0, "farm_id": "$_id.farm_id", "fecha": "$_id.fecha",
+            "lote_origen": "$_id.lote_origen", "tipo": "$_id.tipo",
+            "cantidad": 1, "peso_total": 1, "registros": 1,
+        }},
+        {"$out": "egg_daily_rollups"},
+    ]).to_list(None)
+    await db.transactions.aggregate([
+        {"$unionWith": ARCHIVES["transactions"][0]},
+        {"$group": {
+            "_id": {
+                "farm_id": "$farm_id",
+                "mes": {"$dateTrunc": {"date": "$fecha", "unit": "month"}},
+                "tipo": "$tipo",
+                "categoria": "$categoria",
+            },
+            "total": {"$sum": "$total"},
+            "registros": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0, "farm_id": "$_id.farm_id", "mes": "$_id.mes", "tipo": "$_id.tipo", "categoria": "$_id.categoria",
+            "total": 1, "registros": 1,
+        }},
+        {"$out": "transaction_monthly_rollups"},
+    ]).to_list(None)
+    await db.egg_analytics_buckets.delete_many({})
+    # Routes served from the rollups depend on the raw collections' versions
+    farm_ids = set(await db.collection_versions.distinct("farm_id"))
+    for collection in ("egg_collections", "transactions", *(ARCHIVES[name][0] for name in ARCHIVES)):
+        farm_ids.update(await db[collection].distinct("farm_id"))
+    for farm_id in farm_ids:
+        with farm_scope(farm_id):
+            await collections_changed("egg_collections", "transactions")
+    return {
+        "egg_daily_rollups": await db.egg_daily_rollups.count_documents({}),
+        "transaction_monthly_rollups": await db.transaction_monthly_rollups.count_documents({}),
+    }
+
+# Archive tier
+# egg_collections and transactions keep only the last ARCHIVE_HOT_MONTHS months
+# (the current one included). Older months are moved, one farm and month at a
+# time, into <collection>_archive, created with a zstd block compressor, so the
+# indexes that serve the hot path stay small enough to remain in cache as
+# history grows. A month is only moved once the documents in both tiers add up
+# to its rollups, which dashboards, balances and analytics keep reading.
+# List routes, exports and lot summaries read both tiers when the requested
+# range reaches past the horizon. With ARCHIVE_PARQUET_DIR set, each archived
+# month is also written there as one Parquet file per farm.
+ARCHIVE_HOT_MONTHS = max(1, int(os.environ.get("ARCHIVE_HOT_MONTHS", "3")))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_PARQUET_DIR = os.environ.get("ARCHIVE_PARQUET_DIR")
+# collection -> (archive, rollups, rollup date field, rollup key fields, summed fields)
+ARCHIVES = {
+    "egg_collections": (
+        "egg_collections_archive", "egg_daily_rollups", "fecha", ("fecha", "lote_origen", "tipo"),
+        ("cantidad", "peso_total"),
+    ),
+    "transactions": ("transactions_archive", "transaction_monthly_rollups", "mes", ("tipo", "categoria"), ("total",)),
+}
+
+def archive_horizon():
+    """First day of the oldest month kept in the hot tier."""
+    month = date.today().replace(day=1)
+    for _ in range(ARCHIVE_HOT_MONTHS - 1):
+        month = (month - timedelta(days=1)).replace(day=1)
+    return date_to_datetime(month)
+
+def reaches_archive(collection, bounds):
+    """Whether a query with these bounds on `fecha` may match archived documents."""
+    if collection not in ARCHIVES:
+        return False
+    return not (isinstance(bounds, dict) and bounds.get("$gte") is not None and bounds["$gte"] >= archive_horizon())
+
+def tiered_find(collection, date_field, query, projection, sort, limit=None, batch_size=None):
+    """Documents of `collection` and, if the range reaches archived months, of its archive.
+
+    A limited read merges both tiers, each sorted and limited on its own
+    indexes first. An unbounded read (streams, exports) returns the tiers one
+    after the other, oldest first when ascending, instead of sorting them
+    together; a document recorded late for an archived month comes out of
+    order until the next archive run moves it.
+    """
+    def tier_cursor(name):
+        cursor = db[name].find(query, projection).sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor.limit(limit) if limit else cursor
+
+    if not reaches_archive(collection, query.get(date_field)):
+        return tier_cursor(collection)
+    archive = ARCHIVES[collection][0]
+    if not limit:
+        tiers = [archive, collection] if sort[0][1] > 0 else [collection, archive]
+        return chain_cursors(tier_cursor(name) for name in tiers)
+    tier = [{"$match": query}, {"$sort": dict(sort)}, {"$limit": limit}, {"$project": projection}]
+    return db[collection].aggregate([
+        *tier,
+        {"$unionWith": {"coll": archive, "pipeline": tier}},
+        {"$sort": dict(sort)},
+        {"$limit": limit},
+    ])
+
+async def chain_cursors(cursors):
+    for cursor in cursors:
+        async for doc in cursor:
+            yield doc
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+async def rollups_match(collection, month):
+    """Compare the current farm's raw documents of `month`, across both tiers, with its rollups."""
+    archive, rollups, rollup_date, keys, sums = ARCHIVES[collection]
+    query = farm_query({"fecha": {"$gte": month, "$lt": next_month(month)}})
+    raw = await db[collection].aggregate([
+        {"$match": query},
+        {"$unionWith": {"coll": archive, "pipeline": [{"$match": query}]}},
+        {"$group": {
+            "_id": {key: f"${key}" for key in keys},
+            **{field: {"$sum": f"${field}"} for field in sums},
+            "registros": {"$sum": 1},
+        }},
+    ]).to_list(None)
+    expected = await db[rollups].find(
+        farm_query({rollup_date: {"$gte": month, "$lt": next_month(month)}})
+    ).to_list(None)
+
+    def totals(rows, key_of):
+        return {key_of(row): (row["registros"], *(row[field] for field in sums)) for row in rows}
+
+    raw_totals = totals(raw, lambda row: tuple(row["_id"][key] for key in keys))
+    expected_totals = totals(expected, lambda row: tuple(row[key] for key in keys))
+    return raw_totals.keys() == expected_totals.keys() and all(
+        raw_totals[key][0] == expected_totals[key][0]
+        and all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) for a, b in zip(raw_totals[key][1:], expected_totals[key][1:]))
+        for key in raw_totals
+    )
+
+async def archive_month(collection, month):
+    """Move the current farm's documents of `month` to the archive; returns how many moved.
+
+    Each batch is copied before it is deleted, so an interrupted run leaves
+    documents at worst in both tiers, and re-running it converges.
+    """
+    archive = ARCHIVES[collection][0]
+    query = farm_query({"fecha": {"$gte": month, "$lt": next_month(month)}})
+    moved = 0
+    while True:
+        docs = await db[collection].find(query).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not docs:
+            return moved
+        await db[archive].bulk_write([
+            ReplaceOne(farm_query({"id": doc["id"]}), doc, upsert=True) for doc in docs
+        ], ordered=False)
+        await db[collection].delete_many(farm_query({"id": {"$in": [doc["id"] for doc in docs]}}))
+        moved += len(docs)
+
+async def write_archive_snapshot(collection, month):
+    if pa is None:
+        logger.warning("ARCHIVE_PARQUET_DIR is set but pyarrow is not installed; skipping snapshot")
+        return
+    model = EXPORTS[ExportCollection(collection)][0]
+    docs = await db[ARCHIVES[collection][0]].find(
+        farm_query({"fecha": {"$gte": month, "$lt": next_month(month)}}), model_projection(model)
+    ).sort([("fecha", 1), ("id", 1)]).to_list(None)
+    path = Path(ARCHIVE_PARQUET_DIR) / collection / current_farm() / f"{month:%Y-%m}.parquet"
+
+    def write():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(pa.Table.from_pylist(docs, schema=parquet_schema(model)), path, compression="zstd")
+
+    await asyncio.to_thread(write)
+
+async def delete_archive(collection):
+    """Remove the current farm's archived documents and Parquet snapshots of `collection`."""
+    await db[ARCHIVES[collection][0]].delete_many(farm_query())
+    if ARCHIVE_PARQUET_DIR:
+        path = Path(ARCHIVE_PARQUET_DIR) / collection / current_farm()
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+
+async def archive_closed_months():
+    """Archive every month of every farm older than the hot horizon whose rollups match."""
+    horizon = archive_horizon()
+    moved = 0
+    for collection in ARCHIVES:
+        for farm_id in await db[collection].distinct("farm_id"):
+            with farm_scope(farm_id):
+                months = await db[collection].aggregate([
+                    {"$match": farm_query({"fecha": {"$lt": horizon}})},
+                    {"$group": {"_id": {"$dateTrunc": {"date": "$fecha", "unit": "month"}}}},
+                    {"$sort": {"_id": 1}},
+                ]).to_list(None)
+                archived = 0
+                for month in (row["_id"] for row in months):
+                    if not await rollups_match(collection, month):
+                        logger.warning("Not archiving %s %s of farm %s: rollups do not match", collection,
+                                       f"{month:%Y-%m}", farm_id)
+                        continue
+                    archived += await archive_month(collection, month)
+                    if ARCHIVE_PARQUET_DIR:
+                        await write_archive_snapshot(collection, month)
+                if archived:
+                    await collections_changed(collection)
+                moved += archived
+    return moved
+
+# Read cache
+# Hot GET handlers cache their rendered JSON body keyed by route and query
+# parameters. Every entry is tagged with the collections it was computed from
+# and write handlers evict exactly those tags (see collections_changed()).
+# Set CACHE_URL=redis://host:port/0 to share the cache between uvicorn workers.
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))
+CACHED_HEADERS = ("x-next-cursor",)
+
+class MemoryCache:
+    """Bounded LRU with a per-entry TTL, local to this process."""
+    backend = "memory"
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self.keys_by_tag = defaultdict(set)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            for tag in entry[2]:
+                self.keys_by_tag[tag].discard(key)
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < monotonic():
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key, value, tags):
+        self._drop(key)
+        self.entries[key] = (monotonic() + self.ttl, value, tuple(tags))
+        for tag in tags:
+            self.keys_by_tag[tag].add(key)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+
+    async def invalidate(self, tags):
+        for tag in tags:
+            for key in list(self.keys_by_tag.pop(tag, ())):
+                self._drop(key)
+
+    async def size(self):
+        return len(self.entries)
+
+class RedisCache:
+    """Cache shared by several workers through any Redis-protocol server.
+
+    Each tag is a set holding the keys computed from it, so invalidation only
+    deletes the affected entries.
+    """
+    backend = "redis"
+
+    def __init__(self, url, ttl, prefix="gallinapp:cache:"):
+        if redis_asyncio is None:
+            raise RuntimeError("CACHE_URL requires the 'redis' package")
+        self.redis = redis_asyncio.from_url(url)
+        self.ttl_ms = int(ttl * 1000)
+        self.prefix = prefix
+
+    async def get(self, key):
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key, value, tags):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self.prefix + key, value, px=self.ttl_ms)
+        for tag in tags:
+            pipe.sadd(self.prefix + "tag:" + tag, self.prefix + key)
+            pipe.pexpire(self.prefix + "tag:" + tag, self.ttl_ms)
+        await pipe.execute()
+
+    async def invalidate(self, tags):
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            keys = await self.redis.smembers(tag_key)
+            await self.redis.delete(tag_key, *keys)
+
+    async def size(self):
+        return None
+
+def create_cache():
+    cache_url = os.environ.get("CACHE_URL")
+    if cache_url:
+        return RedisCache(cache_url, CACHE_TTL_SECONDS)
+    return MemoryCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+cache = create_cache()
+cache_stats = {"hits": 0, "misses": 0}
+
+def pack_cached(headers, body):
+    return json.dumps(headers).encode() + b"\n" + body
+
+def unpack_cached(value):
+    headers, body = value.split(b"\n", 1)
+    return json.loads(headers), body
+
+def render_json(result):
+    return json.dumps(
+        jsonable_encoder(result), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+async def invalidate_cache(*collections):
+    await cache.invalidate([farm_scoped(collection) for collection in collections])
+
+def cache_key(name, params):
+    params = sorted(
+        (param, str(value)) for param, value in params.items()
+        if value is not None and not isinstance(value, (Request, Response))
+    )
+    return farm_scoped(f"{name}?{urlencode(params)}")
+
+def cached(*collections, tags=None, versions=()):
+    """Serve a GET handler from the read cache; entries depend on `collections`.
+
+    `tags`, if given, maps the handler's parameters to extra invalidation tags.
+    A result is only stored if the versions of `collections` (and of
+    `versions`, for handlers invalidated by tags alone) did not move while it
+    was computed.
+    """
+    watched = (*collections, *versions)
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        inject_response = "response" not in signature.parameters
+        parameters = list(signature.parameters.values())
+        if inject_response:
+            parameters.append(inspect.Parameter("response", inspect.Parameter.KEYWORD_ONLY, annotation=Response))
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            response = kwargs.pop("response") if inject_response else kwargs["response"]
+            if kwargs.get("stream"):
+                return await func(**kwargs)
+            key = cache_key(func.__name__, kwargs)
+
+            value = await cache.get(key)
+            if value is not None:
+                cache_stats["hits"] += 1
+                headers, body = unpack_cached(value)
+            else:
+                cache_stats["misses"] += 1
+                version = await current_etag(watched)
+                result = await func(**kwargs)
+                if isinstance(result, StreamingResponse):
+                    return result
+                body = result.body if isinstance(result, Response) else render_json(result)
+                headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+                entry_tags = [*collections, *(tags(kwargs) if tags else [])]
+                await cache_if_unchanged(
+                    key, pack_cached(headers, body), [farm_scoped(tag) for tag in entry_tags], watched, version
+                )
+            return Response(body, media_type="application/json", headers={**headers, **response.headers})
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+    return decorator
+
+# Collection versions
+# Every write bumps a per-farm, per-collection counter in `collection_versions`.
+# GET routes derive a weak ETag from the counters they depend on and answer a
+# matching If-None-Match with 304 after reading only those tiny documents.
+async def bump_versions(*collections):
+    await db.collection_versions.bulk_write([
+        UpdateOne(
+            {"_id": farm_scoped(collection)},
+            {"$inc": {"version": 1}, "$setOnInsert": {"farm_id": current_farm(), "coleccion": collection}},
+            upsert=True,
+        )
+        for collection in collections
+    ], ordered=False)
+
+async def collections_changed(*collections):
+    # Versions move before the cache is evicted; cache_if_unchanged() relies on it
+    await bump_versions(*collections)
+    await invalidate_cache(*collections)
+    if not DASHBOARD_CHANGE_STREAM:
+        dashboard_hub().schedule(*collections)
+
+async def current_etag(collections):
+    ids = [farm_scoped(collection) for collection in collections]
+    versions = await db.collection_versions.find({"_id": {"$in": ids}}).to_list(None)
+    by_id = {version["_id"]: version["version"] for version in versions}
+    tag = ".".join(str(by_id.get(version_id, 0)) for version_id in ids)
+    # Routes such as the dashboard depend on today's date as well
+    return f'W/"{tag}-{date.today().strftime("%Y%m%d")}"'
+
+async def cache_if_unchanged(key, value, tags, collections, version):
+    """Cache `value` unless `collections` moved past `version` while it was computed.
+
+    A write that lands between the check and the set has already bumped the
+    version when it evicts, so the second check removes what it missed.
+    """
+    if await current_etag(collections) != version:
+        return
+    await cache.set(key, value, tags)
+    if await current_etag(collections) != version:
+        await cache.invalidate(tags)
+
+def etag_matches(if_none_match, etag):
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in [c.removeprefix("W/") for c in candidates]
+
+def collection_etag(*collections):
+    """Route dependency answering conditional GETs from collection versions."""
+    async def check_etag(request: Request, response: Response):
+        etag = await current_etag(collections)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            raise HTTPException(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    return Depends(check_etag)
+
+def analytics_etag(*collections):
+    """Dependencies of a route that reads `analytics_db`: its ETag, if it reads the primary."""
+    return [collection_etag(*collections)] if ANALYTICS_READ_PREFERENCE == "primary" else []
+
+def analytics_cached(*collections, **options):
+    """`cached` for routes that read `analytics_db`; a no-op if it may lag the primary."""
+    if ANALYTICS_READ_PREFERENCE == "primary":
+        return cached(*collections, **options)
+    return lambda func: func
+
+# Idempotent writes
+# Clients that retry after losing connectivity send an Idempotency-Key header.
+# The first request with a key claims it in `idempotency_keys` and stores its
+# response; a retry with the same key and body gets that response back instead
+# of inserting a duplicate. Keys are scoped per farm and handler and expire
+# after IDEMPOTENCY_TTL_SECONDS. A request that fails releases its key; one
+# whose worker died holds it only until `locked_until`, after which a retry
+# with the same body takes the claim over.
+def request_fingerprint(payload):
+    return hashlib.sha256(render_json(payload)).hexdigest()
+
+def idempotency_id(scope, key):
+    return farm_scoped(f"{scope}:{key}")
+
+async def reserve_idempotency_keys(scope, entries):
+    """Claim (key, fingerprint) pairs; returns the records of keys that were already claimed."""
+    now = datetime.utcnow()
+    locked_until = now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    docs = [
+        {
+            "_id": idempotency_id(scope, key), "estado": "en_curso", "fingerprint": fingerprint,
+            "created_at": now, "locked_until": locked_until,
+        }
+        for key, fingerprint in entries
+    ]
+    if not docs:
+        return {}
+    try:
+        await db.idempotency_keys.insert_many(docs, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        write_errors = e.details["writeErrors"]
+        if any(write_error["code"] != 11000 for write_error in write_errors):
+            raise
+        claimed = [docs[write_error["index"]]["_id"] for write_error in write_errors]
+    records = await db.idempotency_keys.find({"_id": {"$in": claimed}}).to_list(None)
+    prefix = len(idempotency_id(scope, ""))
+    fingerprints = dict(entries)
+    taken = {}
+    for record in records:
+        key = record["_id"][prefix:]
+        # Claims made before leases existed run out a lease after created_at
+        lease_end = record.get("locked_until") or record["created_at"] + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        if record["estado"] == "en_curso" and record["fingerprint"] == fingerprints[key] and lease_end <= now:
+            # Only one retry wins the expired lease
+            result = await db.idempotency_keys.update_one(
+                {"_id": record["_id"], "estado": "en_curso", "locked_until": record.get("locked_until")},
+                {"$set": {"locked_until": locked_until, "created_at": now}},
+            )
+            if result.modified_count:
+                continue
+        taken[key] = record
+    return taken
+
+async def complete_idempotency_keys(scope, results):
+    await db.idempotency_keys.bulk_write([
+        UpdateOne(
+            {"_id": idempotency_id(scope, key)},
+            {"$set": {"estado": "completado", "status_code": status_code, "body": body}},
+        )
+        for key, status_code, body in results
+    ], ordered=False)
+
+async def release_idempotency_keys(scope, keys):
+    await db.idempotency_keys.delete_many({"_id": {"$in": [idempotency_id(scope, key) for key in keys]}})
+
+def replay_response(record, fingerprint):
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otra petición")
+    if record["estado"] != "completado":
+        raise HTTPException(status_code=409, detail="Hay una petición con esta Idempotency-Key en curso")
+    return Response(
+        record["body"], status_code=record["status_code"], media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+def idempotent(func):
+    """Make a POST handler replay its stored response for a repeated Idempotency-Key."""
+    signature = inspect.signature(func)
+    parameters = [*signature.parameters.values(), inspect.Parameter(
+        "idempotency_key", inspect.Parameter.KEYWORD_ONLY, annotation=Optional[str],
+        default=Header(None, alias="Idempotency-Key", min_length=1, max_length=255),
+    )]
+
+    @functools.wraps(func)
+    async def wrapper(**kwargs):
+        key = kwargs.pop("idempotency_key")
+        if key is None:
+            return await func(**kwargs)
+        fingerprint = request_fingerprint(kwargs)
+        claimed = await reserve_idempotency_keys(func.__name__, [(key, fingerprint)])
+        if key in claimed:
+            return replay_response(claimed[key], fingerprint)
+        try:
+            result = await func(**kwargs)
+        except BaseException:
+            await release_idempotency_keys(func.__name__, [key])
+            raise
+        body = result.body if isinstance(result, Response) else render_json(result)
+        await complete_idempotency_keys(func.__name__, [(key, 200, body)])
+        return Response(body, media_type="application/json")
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    return wrapper
+
+# Bulk ingestion
+# Bulk endpoints accept a JSON array, NDJSON (application/x-ndjson) or CSV
+# (text/csv, header row first). NDJSON and CSV bodies are parsed line by line as
+# they arrive and written in unordered insert_many batches, so memory is bounded
+# by BULK_BATCH_SIZE rather than by the size of the upload.
+BULK_BATCH_SIZE = 1000
+
+BULK_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {"type": "object"}}},
+            "application/x-ndjson": {"schema": {"type": "string"}},
+            "text/csv": {"schema": {"type": "string"}},
+        },
+    },
+}
+
+def validation_detail(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+        )
+    return str(error)
+
+async def request_lines(request):
+    """Yield the body's lines as (text, decode_error) pairs."""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield decode_line(line)
+    if pending:
+        yield decode_line(pending)
+
+def decode_line(line):
+    # Spreadsheet exports are often Latin-1; such a line fails on its own
+    try:
+        return line.decode("utf-8").rstrip("\r"), None
+    except UnicodeDecodeError:
+        return "", ValueError("La línea no está codificada en UTF-8")
+
+async def bulk_records(request):
+    """Yield (record, parse_error) pairs from the request body."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson"):
+        async for line, decode_error in request_lines(request):
+            if decode_error:
+                yield None, decode_error
+                continue
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError as e:
+                yield None, e
+    elif content_type == "text/csv":
+        header = None
+        async for line, decode_error in request_lines(request):
+            if decode_error:
+                if header is None:
+                    raise HTTPException(status_code=400, detail="La cabecera CSV no está codificada en UTF-8")
+                yield None, decode_error
+                continue
+            if not line.strip():
+                continue
+            row = next(csv.reader([line]))
+            if header is None:
+                header = [column.strip() for column in row]
+                continue
+            # Empty CSV cells mean "not provided" for optional fields
+            yield {column: (value if value != "" else None) for column, value in zip(header, row)}, None
+    else:
+        try:
+            records = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="El cuerpo debe ser una lista JSON")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="El cuerpo debe ser una lista JSON")
+        for record in records:
+            yield record, None
+
+async def insert_bulk_batch(collection, batch, apply_rollups, result):
+    docs = [doc for _, doc in batch]
+    failed = set()
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details["writeErrors"]:
+            failed.add(write_error["index"])
+            result.errores.append(BulkItemError(indice=batch[write_error["index"]][0], detalle=write_error["errmsg"]))
+    inserted = [doc for position, doc in enumerate(docs) if position not in failed]
+    result.insertados += len(inserted)
+    await apply_rollups(inserted)
+    if collection.name in LOT_FIELDS:
+        await lots_written(*{doc[LOT_FIELDS[collection.name]] for doc in inserted})
+
+async def bulk_insert(request, create_model, build, collection, apply_rollups):
+    result = BulkResult()
+    batch = []
+    index = 0
+    try:
+        async for record, parse_error in bulk_records(request):
+            try:
+                if parse_error:
+                    raise parse_error
+                batch.append((index, build(create_model.model_validate(record)).model_dump()))
+            except ValueError as e:
+                result.errores.append(BulkItemError(indice=index, detalle=validation_detail(e)))
+            index += 1
+            if len(batch) >= BULK_BATCH_SIZE:
+                await insert_bulk_batch(collection, batch, apply_rollups, result)
+                batch = []
+        if batch:
+            await insert_bulk_batch(collection, batch, apply_rollups, result)
+    finally:
+        # Batches inserted before a failure are already in the rollups
+        if result.insertados:
+            await collections_changed(collection.name)
+    return result
+
 # Routes - Animals
-@api_router.post("/animals", response_model=Animal)
-async def create_animal(animal: AnimalCreate):
-    animal_dict = animal.dict()
+def build_animal(animal: AnimalCreate):
+    animal_dict = animal.model_dump()
     # Convert date to datetime for MongoDB compatibility
     animal_dict["fecha_ingreso"] = date_to_datetime(animal_dict["fecha_ingreso"])
-    animal_obj = Animal(**animal_dict)
-    await db.animals.insert_one(animal_obj.dict())
+    animal_dict["edad_ingreso_dias"] = animal_dict["edad_dias"]
+    return Animal(**animal_dict)
+
+@api_router.post("/animals", response_model=Animal)
+@idempotent
+async def create_animal(animal: AnimalCreate):
+    animal_obj = build_animal(animal)
+    await db.animals.insert_one(animal_obj.model_dump())
+    await collections_changed("animals")
+    await lots_written(animal_obj.lote)
+    await refresh_lot_kpis(animal_obj.lote)
     return animal_obj
 
-@api_router.get("/animals", response_model=List[Animal])
-async def get_animals():
-    animals = await db.animals.find().to_list(1000)
-    return [Animal(**animal) for animal in animals]
+@api_router.get("/animals", response_model=List[Animal], dependencies=[collection_etag("animals")])
+@cached("animals")
+async def get_animals(
+    response: Response,
+    filters: ListFilters = Depends(list_filters(Animal, "fecha_ingreso", tipo=AnimalType, estado=AnimalStatus, lote=str, raza=str)),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    stream: bool = Query(False, description="Transmitir todos los registros como NDJSON"),
+):
+    return await list_documents(db.animals, filters, response, limit, after, stream)
 
-@api_router.get("/animals/{animal_id}", response_model=Animal)
-async def get_animal(animal_id: str):
-    animal = await db.animals.find_one({"id": animal_id})
+@api_router.get("/animals/{animal_id}", response_model=Animal, dependencies=[collection_etag("animals")])
+async def get_animal(animal_id: str, response: Response):
+    animal = await db.animals.find_one(farm_query({"id": animal_id}), model_projection(Animal))
     if not animal:
         raise HTTPException(status_code=404, detail="Animal no encontrado")
-    return Animal(**animal)
+    return json_response(animal, response)
 
 @api_router.put("/animals/{animal_id}", response_model=Animal)
 async def update_animal(animal_id: str, animal_update: AnimalUpdate):
-    existing_animal = await db.animals.find_one({"id": animal_id})
-    if not existing_animal:
-        raise HTTPException(status_code=404, detail="Animal no encontrado")
-    
-    update_data = animal_update.dict(exclude_unset=True)
+    update_data = animal_update.model_dump(exclude_unset=True)
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.animals.update_one({"id": animal_id}, {"$set": update_data})
-    updated_animal = await db.animals.find_one({"id": animal_id})
+    updated_animal = await db.animals.find_one_and_update(
+        farm_query({"id": animal_id}), {"$set": update_data},
+        projection=model_projection(Animal), return_document=ReturnDocument.AFTER,
+    )
+    if not updated_animal:
+        raise HTTPException(status_code=404, detail="Animal no encontrado")
+    await collections_changed("animals")
+    await lots_written(updated_animal["lote"])
+    await refresh_lot_kpis(updated_animal["lote"])
     return Animal(**updated_animal)
 
 @api_router.delete("/animals/{animal_id}")
 async def delete_animal(animal_id: str):
-    result = await db.animals.delete_one({"id": animal_id})
-    if result.deleted_count == 0:
+    deleted_animal = await db.animals.find_one_and_delete(farm_query({"id": animal_id}), {"lote": 1})
+    if not deleted_animal:
         raise HTTPException(status_code=404, detail="Animal no encontrado")
+    await collections_changed("animals")
+    await lots_written(deleted_animal["lote"])
+    await refresh_lot_kpis(deleted_animal["lote"])
     return {"message": "Animal eliminado exitosamente"}
 
+# Routes - Animal movements
+# Deaths, sales and transfers take birds out of a lot with a conditional
+# decrement: the filter requires an active lot with enough birds, so concurrent
+# movements can never drive `cantidad` below zero, and a lot that reaches zero
+# takes the matching estado in the same update. A mortality is that single
+# update. Sales and transfers also write a second document (the Transaction,
+# the destination lot), so both writes run in one multi-document transaction
+# (replica set required) and the count and the ledger commit or fail together.
+def withdraw_birds(cantidad, counter, estado_final):
+    """Update pipeline moving `cantidad` birds out of `cantidad` into `counter`."""
+    return [
+        {"$set": {
+            "cantidad": {"$subtract": ["$cantidad", cantidad]},
+            counter: {"$add": [{"$ifNull": [f"${counter}", 0]}, cantidad]},
+            "updated_at": "$$NOW",
+        }},
+        {"$set": {"estado": {"$cond": [{"$eq": ["$cantidad", 0]}, estado_final, "$estado"]}}},
+    ]
+
+async def withdraw(animal_id, cantidad, counter, estado_final, session=None):
+    animal = await db.animals.find_one_and_update(
+        farm_query({"id": animal_id, "estado": AnimalStatus.ACTIVO.value, "cantidad": {"$gte": cantidad}}),
+        withdraw_birds(cantidad, counter, estado_final.value),
+        projection=model_projection(Animal),
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if animal is None:
+        # Failure path only: tell a missing lot from one without enough birds
+        if not await db.animals.count_documents(farm_query({"id": animal_id}), limit=1, session=session):
+            raise HTTPException(status_code=404, detail="Animal no encontrado")
+        raise HTTPException(status_code=409, detail="El lote no está activo o no tiene suficientes aves")
+    return animal
+
+async def run_transaction(callback):
+    async with await client.start_session() as session:
+        try:
+            return await session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code == 20:  # IllegalOperation: standalone mongod
+                raise HTTPException(status_code=503, detail="Esta operación requiere MongoDB en réplica (transacciones)")
+            raise
+
+@api_router.post("/animals/{animal_id}/mortalidad", response_model=Animal)
+@idempotent
+async def record_mortality(animal_id: str, mortality: AnimalMortality):
+    animal = await withdraw(animal_id, mortality.cantidad, "bajas", AnimalStatus.MUERTO)
+    await collections_changed("animals")
+    await lots_written(animal["lote"])
+    await refresh_lot_kpis(animal["lote"])
+    return Animal(**animal)
+
+@api_router.post("/animals/{animal_id}/venta", response_model=AnimalSaleResult)
+@idempotent
+async def record_sale(animal_id: str, sale: AnimalSale):
+    async def sell(session):
+        animal = await withdraw(animal_id, sale.cantidad, "vendidos", AnimalStatus.VENDIDO, session)
+        transaction = Transaction(
+            fecha=date_to_datetime(sale.fecha or date.today()),
+            tipo=TransactionType.INGRESO,
+            concepto=sale.concepto,
+            categoria=sale.categoria,
+            cantidad=sale.cantidad,
+            unidad="aves",
+            precio_unitario=sale.precio_unitario,
+            total=sale.cantidad * sale.precio_unitario,
+            lote=animal["lote"],
+            observaciones=sale.observaciones,
+        )
+        transaction_doc = transaction.model_dump()
+        await db.transactions.insert_one(dict(transaction_doc), session=session)
+        await apply_transaction_rollups([transaction_doc], session=session)
+        return AnimalSaleResult(animal=Animal(**animal), transaccion=transaction)
+
+    result = await run_transaction(sell)
+    await collections_changed("animals", "transactions")
+    await lots_written(result.animal.lote)
+    await refresh_lot_kpis(result.animal.lote)
+    return result
+
+@api_router.post("/animals/{animal_id}/transferencia", response_model=AnimalTransferResult)
+@idempotent
+async def record_transfer(animal_id: str, transfer: AnimalTransfer):
+    async def move(session):
+        origen = await withdraw(animal_id, transfer.cantidad, "transferidos", AnimalStatus.TRANSFERIDO, session)
+        if origen["lote"] == transfer.lote_destino:
+            raise HTTPException(status_code=400, detail="El lote de destino debe ser distinto del de origen")
+        nuevo = Animal(
+            lote=transfer.lote_destino, tipo=origen["tipo"], raza=origen["raza"], cantidad=0,
+            fecha_ingreso=date_to_datetime(date.today()), edad_dias=origen["edad_dias"],
+            peso_promedio=origen["peso_promedio"],
+        ).model_dump(exclude={"cantidad", "updated_at"})
+        nuevo["edad_ingreso_dias"] = nuevo["edad_dias"]
+        # Birds join an active lot of the same code, type and breed, or start
+        # one. The write targets the lot by id so it carries the full shard key.
+        existente = await db.animals.find_one(
+            farm_query({"lote": transfer.lote_destino, "tipo": origen["tipo"], "raza": origen["raza"],
+                        "estado": AnimalStatus.ACTIVO.value}),
+            {"_id": 0, "id": 1},
+            session=session,
+        )
+        destino = await db.animals.find_one_and_update(
+            farm_query({"id": existente["id"] if existente else nuevo["id"]}),
+            {
+                "$inc": {"cantidad": transfer.cantidad},
+                "$set": {"updated_at": datetime.utcnow()},
+                "$setOnInsert": {field: value for field, value in nuevo.items() if field not in ("farm_id", "id")},
+            },
+            projection=model_projection(Animal),
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        return AnimalTransferResult(origen=Animal(**origen), destino=Animal(**destino))
+
+    result = await run_transaction(move)
+    await collections_changed("animals")
+    await lots_written(result.origen.lote, result.destino.lote)
+    await refresh_lot_kpis(result.origen.lote, result.destino.lote)
+    return result
+
 # Routes - Incubation
-@api_router.post("/incubation", response_model=IncubationBatch)
-async def create_incubation(incubation: IncubationCreate):
-    incubation_dict = incubation.dict()
+def build_incubation(incubation: IncubationCreate):
+    incubation_dict = incubation.model_dump()
     # Convert dates to datetime for MongoDB compatibility
     incubation_dict["fecha_incubacion"] = date_to_datetime(incubation_dict["fecha_incubacion"])
     incubation_dict["fecha_eclosion_esperada"] = date_to_datetime(incubation_dict["fecha_eclosion_esperada"])
-    incubation_obj = IncubationBatch(**incubation_dict)
-    await db.incubation_batches.insert_one(incubation_obj.dict())
+    return IncubationBatch(**incubation_dict)
+
+@api_router.post("/incubation", response_model=IncubationBatch)
+@idempotent
+async def create_incubation(incubation: IncubationCreate):
+    incubation_obj = build_incubation(incubation)
+    await db.incubation_batches.insert_one(incubation_obj.model_dump())
+    await collections_changed("incubation_batches")
+    await lots_written(incubation_obj.lote)
+    await refresh_lot_kpis(incubation_obj.lote)
     return incubation_obj
 
-@api_router.get("/incubation", response_model=List[IncubationBatch])
-async def get_incubation_batches():
-    batches = await db.incubation_batches.find().to_list(1000)
-    return [IncubationBatch(**batch) for batch in batches]
+@api_router.get("/incubation", response_model=List[IncubationBatch], dependencies=[collection_etag("incubation_batches")])
+@cached("incubation_batches")
+async def get_incubation_batches(
+    response: Response,
+    filters: ListFilters = Depends(list_filters(IncubationBatch, "fecha_incubacion", estado=IncubationStatus, tipo_huevo=AnimalType, lote=str)),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    stream: bool = Query(False, description="Transmitir todos los registros como NDJSON"),
+):
+    return await list_documents(db.incubation_batches, filters, response, limit, after, stream)
 
 @api_router.put("/incubation/{batch_id}", response_model=IncubationBatch)
 async def update_incubation(batch_id: str, incubation_update: IncubationUpdate):
-    existing_batch = await db.incubation_batches.find_one({"id": batch_id})
+    existing_batch = await db.incubation_batches.find_one(farm_query({"id": batch_id}))
     if not existing_batch:
         raise HTTPException(status_code=404, detail="Lote de incubación no encontrado")
     
-    update_data = incubation_update.dict(exclude_unset=True)
+    update_data = incubation_update.model_dump(exclude_unset=True)
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.incubation_batches.update_one({"id": batch_id}, {"$set": update_data})
-    updated_batch = await db.incubation_batches.find_one({"id": batch_id})
+    await db.incubation_batches.update_one(farm_query({"id": batch_id}), {"$set": update_data})
+    await collections_changed("incubation_batches")
+    updated_batch = await db.incubation_batches.find_one(farm_query({"id": batch_id}))
+    await lots_written(updated_batch["lote"])
+    await refresh_lot_kpis(updated_batch["lote"])
     return IncubationBatch(**updated_batch)
 
+# Routes - Incubation telemetry
+# Incubators post their readings in batches. A request is acknowledged once its
+# readings are in TelemetryBuffer, which coalesces the readings of all batches
+# and writes them every TELEMETRY_FLUSH_SECONDS, or TELEMETRY_FLUSH_SIZE
+# readings if sooner: one insert_many into the `incubation_telemetry`
+# time-series collection and one bulk upsert into each of the 1-minute and
+# 1-hour aggregates that charts read, so charts lag by at most one flush.
+# Alerts are evaluated on the readings as they arrive, against the batch's
+# temperatura and humedad setpoints: a reading out of range opens an alert for
+# that variable (or extends the open one) and a later reading back in range
+# closes it.
+TELEMETRY_FLUSH_SECONDS = float(os.environ.get("TELEMETRY_FLUSH_SECONDS", "2"))
+TELEMETRY_FLUSH_SIZE = int(os.environ.get("TELEMETRY_FLUSH_SIZE", "5000"))
+TELEMETRY_BUFFER_MAX = int(os.environ.get("TELEMETRY_BUFFER_MAX", "100000"))
+TELEMETRY_TOLERANCE = {
+    TelemetryVariable.TEMPERATURA: float(os.environ.get("TELEMETRY_TEMPERATURE_TOLERANCE", "0.5")),
+    TelemetryVariable.HUMEDAD: float(os.environ.get("TELEMETRY_HUMIDITY_TOLERANCE", "10")),
+}
+# resolution -> (collection, datetime fields truncated, default window)
+TELEMETRY_RESOLUTIONS = {
+    TelemetryResolution.MINUTO: ("incubation_telemetry_1m", {"second": 0, "microsecond": 0}, timedelta(days=1)),
+    TelemetryResolution.HORA: (
+        "incubation_telemetry_1h", {"minute": 0, "second": 0, "microsecond": 0}, timedelta(days=30),
+    ),
+}
+TELEMETRY_RAW_WINDOW = timedelta(hours=1)
+
+async def write_telemetry(docs):
+    await db.incubation_telemetry.insert_many(docs, ordered=False)
+    for collection, truncated, _ in TELEMETRY_RESOLUTIONS.values():
+        buckets = defaultdict(list)
+        for doc in docs:
+            buckets[(doc["meta"]["farm_id"], doc["meta"]["batch_id"], doc["ts"].replace(**truncated))].append(doc)
+        await db[collection].bulk_write([
+            UpdateOne(
+                {"farm_id": farm_id, "batch_id": batch_id, "periodo": periodo},
+                {
+                    "$inc": {
+                        "lecturas": len(rows),
+                        "temperatura_suma": sum(row["temperatura"] for row in rows),
+                        "humedad_suma": sum(row["humedad"] for row in rows),
+                    },
+                    "$min": {
+                        "temperatura_min": min(row["temperatura"] for row in rows),
+                        "humedad_min": min(row["humedad"] for row in rows),
+                    },
+                    "$max": {
+                        "temperatura_max": max(row["temperatura"] for row in rows),
+                        "humedad_max": max(row["humedad"] for row in rows),
+                    },
+                },
+                upsert=True,
+            )
+            for (farm_id, batch_id, periodo), rows in buckets.items()
+        ], ordered=False)
+
+class TelemetryBuffer:
+    def __init__(self):
+        self.pending = []
+        self.lock = asyncio.Lock()
+        self.flush_task = None
+
+    async def add(self, docs):
+        if len(self.pending) + len(docs) > TELEMETRY_BUFFER_MAX:
+            # Writes are falling behind: make this request wait for them
+            await self.flush()
+        self.pending.extend(docs)
+        TELEMETRY_BUFFERED.set(len(self.pending))
+        if len(self.pending) >= TELEMETRY_FLUSH_SIZE and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self.lock:
+            docs, self.pending = self.pending, []
+            TELEMETRY_BUFFERED.set(len(self.pending))
+            if docs:
+                try:
+                    await write_telemetry(docs)
+                except Exception:
+                    # Not retried: part of the batch may already be written
+                    logger.exception("Lost %d telemetry readings", len(docs))
+            return len(docs)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(TELEMETRY_FLUSH_SECONDS)
+            await self.flush()
+
+telemetry_buffer = TelemetryBuffer()
+
+async def evaluate_alerts(batch_id, setpoints, readings):
+    """Open, extend or close the batch's alerts from time-ordered readings; returns the alerts touched."""
+    alertas = []
+    for variable in TelemetryVariable:
+        tolerance = TELEMETRY_TOLERANCE[variable]
+        low, high = setpoints[variable.value] - tolerance, setpoints[variable.value] + tolerance
+        values = [(reading.ts, getattr(reading, variable.value)) for reading in readings]
+        out = [position for position, (_, value) in enumerate(values) if not low <= value <= high]
+        query = farm_query({"batch_id": batch_id, "variable": variable.value, "abierta": True})
+        alert = None
+        if out:
+            out_values = [values[position][1] for position in out]
+            alert = await db.incubation_alerts.find_one_and_update(
+                query,
+                {
+                    "$setOnInsert": {
+                        "id": str(uuid.uuid4()), "desde": values[out[0]][0],
+                        "minimo_permitido": low, "maximo_permitido": high,
+                    },
+                    "$min": {"valor_minimo": min(out_values)},
+                    "$max": {"valor_maximo": max(out_values)},
+                    "$inc": {"lecturas": len(out)},
+                    "$set": {"ultimo_valor": out_values[-1]},
+                },
+                projection=model_projection(IncubationAlert),
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        back_in_range = out[-1] + 1 if out else 0
+        if back_in_range < len(values):
+            closed = await db.incubation_alerts.find_one_and_update(
+                query,
+                {"$set": {"abierta": False, "hasta": values[back_in_range][0]}},
+                projection=model_projection(IncubationAlert),
+                return_document=ReturnDocument.AFTER,
+            )
+            alert = closed or alert
+        if alert:
+            alertas.append(IncubationAlert(**alert))
+            if alert["abierta"] and alert["lecturas"] == len(out):  # opened by these readings
+                logger.warning("Incubation batch %s: %s out of range (%s)", batch_id, variable.value, out_values[-1])
+    return alertas
+
+def telemetry_point(doc):
+    lecturas = doc["lecturas"]
+    return {
+        "periodo": doc["periodo"],
+        "lecturas": lecturas,
+        "temperatura_promedio": doc["temperatura_suma"] / lecturas,
+        "temperatura_min": doc["temperatura_min"],
+        "temperatura_max": doc["temperatura_max"],
+        "humedad_promedio": doc["humedad_suma"] / lecturas,
+        "humedad_min": doc["humedad_min"],
+        "humedad_max": doc["humedad_max"],
+    }
+
+@api_router.post("/incubation/{batch_id}/telemetry", response_model=TelemetryIngestResult, status_code=202)
+async def ingest_telemetry(batch_id: str, ingest: TelemetryIngest):
+    batch = await db.incubation_batches.find_one(farm_query({"id": batch_id}), {"_id": 0, "temperatura": 1, "humedad": 1})
+    if not batch:
+        raise HTTPException(status_code=404, detail="Lote de incubación no encontrado")
+    readings = sorted(
+        (reading.model_copy(update={"ts": utc_naive(reading.ts)}) for reading in ingest.lecturas),
+        key=lambda reading: reading.ts,
+    )
+    meta = {"farm_id": current_farm(), "batch_id": batch_id}
+    await telemetry_buffer.add([
+        {"ts": reading.ts, "meta": meta, "temperatura": reading.temperatura, "humedad": reading.humedad}
+        for reading in readings
+    ])
+    TELEMETRY_READINGS.inc(len(readings))
+    alertas = await evaluate_alerts(batch_id, batch, readings)
+    return TelemetryIngestResult(aceptadas=len(readings), alertas=alertas)
+
+@api_router.get("/incubation/{batch_id}/telemetry", response_model=List[TelemetryPoint])
+async def get_telemetry(
+    batch_id: str,
+    resolucion: TelemetryResolution = TelemetryResolution.MINUTO,
+    desde: Optional[datetime] = Query(
+        None, description="Por defecto, 1 hora (crudo), 1 día (1m) o 30 días (1h) antes de `hasta`",
+    ),
+    hasta: Optional[datetime] = Query(None, description="Por defecto, ahora"),
+    limit: int = Query(5000, ge=1, le=50000),
+):
+    """Temperature and humidity of a batch over time, raw or downsampled."""
+    hasta = utc_naive(hasta) if hasta else datetime.utcnow()
+    if resolucion == TelemetryResolution.CRUDA:
+        desde = utc_naive(desde) if desde else hasta - TELEMETRY_RAW_WINDOW
+    else:
+        desde = utc_naive(desde) if desde else hasta - TELEMETRY_RESOLUTIONS[resolucion][2]
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="`desde` debe ser anterior a `hasta`")
+
+    if resolucion == TelemetryResolution.CRUDA:
+        readings = await db.incubation_telemetry.find(
+            {"meta.farm_id": current_farm(), "meta.batch_id": batch_id, "ts": {"$gte": desde, "$lte": hasta}},
+            {"_id": 0, "ts": 1, "temperatura": 1, "humedad": 1},
+        ).sort("ts", 1).limit(limit).to_list(limit)
+        return json_response([
+            {
+                "periodo": reading["ts"], "lecturas": 1,
+                **{f"{variable.value}_{stat}": reading[variable.value]
+                   for variable in TelemetryVariable for stat in ("promedio", "min", "max")},
+            }
+            for reading in readings
+        ])
+    collection = TELEMETRY_RESOLUTIONS[resolucion][0]
+    docs = await db[collection].find(
+        farm_query({"batch_id": batch_id, "periodo": {"$gte": desde, "$lte": hasta}}), {"_id": 0}
+    ).sort("periodo", 1).limit(limit).to_list(limit)
+    return json_response([telemetry_point(doc) for doc in docs])
+
+@api_router.get("/incubation/alerts", response_model=List[IncubationAlert])
+async def get_incubation_alerts(
+    abiertas: bool = Query(True, description="Solo las alertas abiertas"),
+    batch_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    query = farm_query({"abierta": True} if abiertas else {})
+    if batch_id:
+        query["batch_id"] = batch_id
+    alerts = await db.incubation_alerts.find(query, model_projection(IncubationAlert)).sort(
+        [("desde", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    return json_response(alerts)
+
 # Routes - Egg Collection
-@api_router.post("/egg-collection", response_model=EggCollection)
-async def create_egg_collection(egg_collection: EggCollectionCreate):
-    collection_dict = egg_collection.dict()
+def build_egg_collection(egg_collection: EggCollectionCreate):
+    collection_dict = egg_collection.model_dump()
     # Convert date to datetime for MongoDB compatibility
     collection_dict["fecha"] = date_to_datetime(collection_dict["fecha"])
-    collection_obj = EggCollection(**collection_dict)
-    await db.egg_collections.insert_one(collection_obj.dict())
+    return EggCollection(**collection_dict)
+
+@api_router.post("/egg-collection", response_model=EggCollection)
+@idempotent
+async def create_egg_collection(egg_collection: EggCollectionCreate):
+    collection_obj = build_egg_collection(egg_collection)
+    collection_doc = collection_obj.model_dump()
+    await db.egg_collections.insert_one(collection_doc)
+    await apply_egg_rollups([collection_doc])
+    await collections_changed("egg_collections")
+    await lots_written(collection_obj.lote_origen)
     return collection_obj
 
-@api_router.get("/egg-collection", response_model=List[EggCollection])
-async def get_egg_collections():
-    collections = await db.egg_collections.find().sort("fecha", -1).to_list(1000)
-    return [EggCollection(**collection) for collection in collections]
+@api_router.post("/egg-collection/bulk", response_model=BulkResult, openapi_extra=BULK_REQUEST_BODY)
+async def create_egg_collections_bulk(request: Request):
+    return await bulk_insert(request, EggCollectionCreate, build_egg_collection, db.egg_collections, apply_egg_rollups)
 
-@api_router.get("/egg-collection/today", response_model=List[EggCollection])
+@api_router.get("/egg-collection", response_model=List[EggCollection], dependencies=[collection_etag("egg_collections")])
+@cached("egg_collections")
+async def get_egg_collections(
+    response: Response,
+    filters: ListFilters = Depends(list_filters(EggCollection, "fecha", tipo=EggType, lote_origen=str)),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    stream: bool = Query(False, description="Transmitir todos los registros como NDJSON"),
+):
+    return await list_documents(db.egg_collections, filters, response, limit, after, stream)
+
+@api_router.get("/egg-collection/today", response_model=List[EggCollection], dependencies=[collection_etag("egg_collections")])
+@cached("egg_collections")
 async def get_today_egg_collections():
     today = date_to_datetime(date.today())
-    collections = await db.egg_collections.find({"fecha": today}).to_list(1000)
-    return [EggCollection(**collection) for collection in collections]
+    collections = await db.egg_collections.find(farm_query({"fecha": today}), model_projection(EggCollection)).to_list(1000)
+    return json_response(collections)
 
 # Routes - Feed Calculator
+# Consumo diario por ave (kg) según la banda de edad: [(edad mínima en días, kg/día)]
+FEED_CONSUMPTION_TABLE = {
+    AnimalType.PONEDORA: [
+        FeedBand(edad_desde=0, consumo_kg=0.030),  # Pollita
+        FeedBand(edad_desde=42, consumo_kg=0.080),  # Levante
+        FeedBand(edad_desde=140, consumo_kg=0.120),  # Producción
+    ],
+    AnimalType.ENGORDE: [
+        FeedBand(edad_desde=0, consumo_kg=0.025),  # Inicio
+        FeedBand(edad_desde=14, consumo_kg=0.100),  # Crecimiento
+        FeedBand(edad_desde=35, consumo_kg=0.150),  # Finalización
+    ],
+    AnimalType.REPRODUCTOR: [
+        FeedBand(edad_desde=0, consumo_kg=0.160),
+    ],
+}
+
+def band_consumption(bands, ages):
+    """Per-bird daily consumption for an array of ages."""
+    bands = sorted(bands, key=lambda band: band.edad_desde)
+    starts = np.array([band.edad_desde for band in bands])
+    rates = np.array([band.consumo_kg for band in bands])
+    # Ages below the first band use the first band
+    return rates[np.maximum(np.searchsorted(starts, ages, side="right") - 1, 0)]
+
+def lifetime_consumption(bands, edad_dias):
+    """Per-bird kg eaten from hatch until `edad_dias`, at each day's band rate."""
+    return float(band_consumption(bands, np.arange(edad_dias)).sum())
+
+def project_feed(tipos, edades, cantidades, horizonte_dias, tabla):
+    """Daily kg per lot over the horizon as a (lots × days) matrix.
+
+    Each lot ages one day per column, so a lot crossing into the next band
+    mid-horizon switches rate on the day it does.
+    """
+    ages = edades[:, None] + np.arange(horizonte_dias)[None, :]
+    per_bird = np.zeros(ages.shape)
+    for tipo, bands in tabla.items():
+        rows = tipos == tipo.value
+        if rows.any():
+            per_bird[rows] = band_consumption(bands, ages[rows])
+    return per_bird * cantidades[:, None]
+
 @api_router.post("/feed-calculator", response_model=FeedCalculation)
+@idempotent
 async def calculate_feed(feed_data: FeedCalculationCreate):
     # Cálculo de consumo basado en tipo de animal y edad
-    if feed_data.tipo_animal == AnimalType.PONEDORA:
-        if feed_data.edad_dias < 42:  # Pollita
-            consumo_diario = feed_data.cantidad_animales * 0.030  # 30g por día
-        elif feed_data.edad_dias < 140:  # Levante
-            consumo_diario = feed_data.cantidad_animales * 0.080  # 80g por día
-        else:  # Producción
-            consumo_diario = feed_data.cantidad_animales * 0.120  # 120g por día
-    elif feed_data.tipo_animal == AnimalType.ENGORDE:
-        if feed_data.edad_dias < 14:  # Inicio
-            consumo_diario = feed_data.cantidad_animales * 0.025  # 25g por día
-        elif feed_data.edad_dias < 35:  # Crecimiento
-            consumo_diario = feed_data.cantidad_animales * 0.100  # 100g por día
-        else:  # Finalización
-            consumo_diario = feed_data.cantidad_animales * 0.150  # 150g por día
-    else:  # Reproductor
-        consumo_diario = feed_data.cantidad_animales * 0.160  # 160g por día
+    consumo_diario = feed_data.cantidad_animales * float(
+        band_consumption(FEED_CONSUMPTION_TABLE[feed_data.tipo_animal], np.array([feed_data.edad_dias]))[0]
+    )
     
     consumo_mensual = consumo_diario * 30
     costo_estimado = consumo_mensual * feed_data.precio_alimento_kg
     
-    calculation_dict = feed_data.dict()
+    calculation_dict = feed_data.model_dump()
     calculation_dict.update({
         "consumo_diario_kg": consumo_diario,
         "consumo_mensual_kg": consumo_mensual,
@@ -324,43 +2446,116 @@ async def calculate_feed(feed_data: FeedCalculationCreate):
     })
     
     calculation_obj = FeedCalculation(**calculation_dict)
-    await db.feed_calculations.insert_one(calculation_obj.dict())
+    await db.feed_calculations.insert_one(calculation_obj.model_dump())
+    await collections_changed("feed_calculations")
+    await lots_written(calculation_obj.lote)
+    await refresh_lot_kpis(calculation_obj.lote)
     return calculation_obj
 
-@api_router.get("/feed-calculator", response_model=List[FeedCalculation])
-async def get_feed_calculations():
-    calculations = await db.feed_calculations.find().sort("fecha_calculo", -1).to_list(1000)
-    return [FeedCalculation(**calc) for calc in calculations]
+@api_router.get("/feed-calculator", response_model=List[FeedCalculation], dependencies=[collection_etag("feed_calculations")])
+@cached("feed_calculations")
+async def get_feed_calculations(
+    response: Response,
+    filters: ListFilters = Depends(list_filters(FeedCalculation, "fecha_calculo", tipo_animal=AnimalType, lote=str)),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    stream: bool = Query(False, description="Transmitir todos los registros como NDJSON"),
+):
+    return await list_documents(db.feed_calculations, filters, response, limit, after, stream)
+
+@api_router.post("/feed-calculator/plan", response_model=FeedPlan)
+async def plan_feed(plan: FeedPlanRequest):
+    """Project day-by-day feed for many lots at once, following each lot's age bands."""
+    if plan.lotes is None:
+        animals = await db.animals.find(
+            farm_query({"estado": "activo"}), {"_id": 0, "lote": 1, "tipo": 1, "cantidad": 1, "edad_dias": 1}
+        ).to_list(None)
+        lotes = [
+            FeedPlanLot(lote=a["lote"], tipo_animal=a["tipo"], cantidad_animales=a["cantidad"], edad_dias=a["edad_dias"])
+            for a in animals
+        ]
+    else:
+        lotes = plan.lotes
+    tabla = {**FEED_CONSUMPTION_TABLE, **(plan.tabla_consumo or {})}
+    if any(not bands for bands in tabla.values()):
+        raise HTTPException(status_code=400, detail="Cada tipo de animal necesita al menos una banda de consumo")
+
+    daily = project_feed(
+        np.array([lote.tipo_animal.value for lote in lotes], dtype=object),
+        np.array([lote.edad_dias for lote in lotes], dtype=np.int64),
+        np.array([lote.cantidad_animales for lote in lotes], dtype=np.float64),
+        plan.horizonte_dias,
+        tabla,
+    )
+    per_lot = daily.sum(axis=1)
+    farm_daily = daily.sum(axis=0)
+
+    return FeedPlan(
+        horizonte_dias=plan.horizonte_dias,
+        precio_alimento_kg=plan.precio_alimento_kg,
+        consumo_total_kg=float(per_lot.sum()),
+        costo_total=float(per_lot.sum() * plan.precio_alimento_kg),
+        consumo_diario_granja_kg=farm_daily.tolist(),
+        lotes=[
+            FeedPlanLotResult(
+                lote=lote.lote,
+                tipo_animal=lote.tipo_animal,
+                cantidad_animales=lote.cantidad_animales,
+                edad_dias=lote.edad_dias,
+                consumo_total_kg=float(total),
+                costo_total=float(total * plan.precio_alimento_kg),
+                consumo_diario_kg=row.tolist() if plan.detalle_diario else None,
+            )
+            for lote, total, row in zip(lotes, per_lot, daily)
+        ],
+    )
 
 # Routes - Transactions
-@api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
-    transaction_dict = transaction.dict()
+def build_transaction(transaction: TransactionCreate):
+    transaction_dict = transaction.model_dump()
     # Convert date to datetime for MongoDB compatibility
     transaction_dict["fecha"] = date_to_datetime(transaction_dict["fecha"])
-    transaction_obj = Transaction(**transaction_dict)
-    await db.transactions.insert_one(transaction_obj.dict())
+    return Transaction(**transaction_dict)
+
+@api_router.post("/transactions", response_model=Transaction)
+@idempotent
+async def create_transaction(transaction: TransactionCreate):
+    transaction_obj = build_transaction(transaction)
+    transaction_doc = transaction_obj.model_dump()
+    await db.transactions.insert_one(transaction_doc)
+    await apply_transaction_rollups([transaction_doc])
+    await collections_changed("transactions")
+    if transaction_obj.lote:
+        await lots_written(transaction_obj.lote)
     return transaction_obj
 
-@api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions():
-    transactions = await db.transactions.find().sort("fecha", -1).to_list(1000)
-    return [Transaction(**transaction) for transaction in transactions]
+@api_router.post("/transactions/bulk", response_model=BulkResult, openapi_extra=BULK_REQUEST_BODY)
+async def create_transactions_bulk(request: Request):
+    return await bulk_insert(request, TransactionCreate, build_transaction, db.transactions, apply_transaction_rollups)
 
-@api_router.get("/transactions/balance")
+@api_router.get("/transactions", response_model=List[Transaction], dependencies=[collection_etag("transactions")])
+@cached("transactions")
+async def get_transactions(
+    response: Response,
+    filters: ListFilters = Depends(list_filters(Transaction, "fecha", tipo=TransactionType, categoria=str, lote=str)),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    stream: bool = Query(False, description="Transmitir todos los registros como NDJSON"),
+):
+    return await list_documents(db.transactions, filters, response, limit, after, stream)
+
+@api_router.get("/transactions/balance", dependencies=[collection_etag("transactions")])
+@cached("transactions")
 async def get_balance():
-    ingresos = await db.transactions.aggregate([
-        {"$match": {"tipo": "ingreso"}},
-        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-    ]).to_list(1)
-    
-    egresos = await db.transactions.aggregate([
-        {"$match": {"tipo": "egreso"}},
-        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-    ]).to_list(1)
+    # One small document per (mes, tipo, categoria) instead of every transaction
+    balance = await db.transaction_monthly_rollups.aggregate([
+        {"$match": farm_query()},
+        {"$group": {"_id": "$tipo", "total": {"$sum": "$total"}}}
+    ]).to_list(2)
+    totales = {item["_id"]: item["total"] for item in balance}
     
-    total_ingresos = ingresos[0]["total"] if ingresos else 0
-    total_egresos = egresos[0]["total"] if egresos else 0
+    total_ingresos = totales.get("ingreso", 0)
+    total_egresos = totales.get("egreso", 0)
     
     return {
         "total_ingresos": total_ingresos,
@@ -368,99 +2563,1243 @@ async def get_balance():
         "balance": total_ingresos - total_egresos
     }
 
+# Routes - Sync
+# Offline clients upload their queued mutations in one request. Each mutation
+# carries a client-generated id_cliente that works like an Idempotency-Key, so
+# re-sending a queue after a dropped response applies nothing twice. Creates
+# are validated and inserted with one insert_many per collection, then updates
+# are applied in client-time order. An update recorded offline before the
+# target's last change (updated_at) loses to that change and is reported as
+# obsoleta.
+SYNC_CREATES = {
+    SyncOperation.CREAR_ANIMAL: (AnimalCreate, build_animal, "animals", None),
+    SyncOperation.CREAR_INCUBACION: (IncubationCreate, build_incubation, "incubation_batches", None),
+    SyncOperation.CREAR_RECOLECCION: (EggCollectionCreate, build_egg_collection, "egg_collections", apply_egg_rollups),
+    SyncOperation.CREAR_TRANSACCION: (TransactionCreate, build_transaction, "transactions", apply_transaction_rollups),
+}
+SYNC_UPDATES = {
+    SyncOperation.ACTUALIZAR_ANIMAL: (AnimalUpdate, "animals", Animal),
+    SyncOperation.ACTUALIZAR_INCUBACION: (IncubationUpdate, "incubation_batches", IncubationBatch),
+}
+
+def utc_naive(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def sync_outcome(mutation, estado, detalle=None, resultado=None):
+    return SyncOutcome(id_cliente=mutation.id_cliente, estado=estado, detalle=detalle, resultado=resultado)
+
+def replayed_outcome(mutation, record, fingerprint):
+    if record["fingerprint"] != fingerprint:
+        return sync_outcome(mutation, SyncStatus.ERROR, "id_cliente ya usado con otra mutación")
+    if record["estado"] != "completado":
+        return sync_outcome(mutation, SyncStatus.ERROR, "Mutación con este id_cliente en curso")
+    return SyncOutcome(**{**json.loads(record["body"]), "estado": SyncStatus.DUPLICADA})
+
+async def apply_sync_creates(mutations, outcomes, touched):
+    batches = defaultdict(list)
+    for mutation in mutations:
+        create_model, build, _, _ = SYNC_CREATES[mutation.operacion]
+        try:
+            doc = build(create_model.model_validate(mutation.datos)).model_dump()
+        except ValueError as e:
+            outcomes[mutation.id_cliente] = sync_outcome(mutation, SyncStatus.ERROR, validation_detail(e))
+            continue
+        batches[mutation.operacion].append((mutation, doc))
+    for operacion, entries in batches.items():
+        _, _, collection, apply_rollups = SYNC_CREATES[operacion]
+        docs = [doc for _, doc in entries]
+        # insert_many adds `_id` to the documents it is given
+        await db[collection].insert_many([dict(doc) for doc in docs])
+        if apply_rollups:
+            await apply_rollups(docs)
+        touched[collection].update(doc[LOT_FIELDS[collection]] for doc in docs)
+        for mutation, doc in entries:
+            outcomes[mutation.id_cliente] = sync_outcome(mutation, SyncStatus.APLICADA, resultado=jsonable_encoder(doc))
+
+async def apply_sync_update(mutation, touched):
+    update_model, collection, model = SYNC_UPDATES[mutation.operacion]
+    if not mutation.objetivo_id:
+        return sync_outcome(mutation, SyncStatus.ERROR, "objetivo_id es obligatorio para las actualizaciones")
+    try:
+        update_data = update_model.model_validate(mutation.datos).model_dump(exclude_unset=True)
+    except ValueError as e:
+        return sync_outcome(mutation, SyncStatus.ERROR, validation_detail(e))
+    update_data["updated_at"] = datetime.utcnow()
+    updated = await db[collection].find_one_and_update(
+        farm_query({"id": mutation.objetivo_id, "updated_at": {"$lte": utc_naive(mutation.fecha_cliente)}}),
+        {"$set": update_data},
+        projection=model_projection(model),
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated is None:
+        if await db[collection].count_documents(farm_query({"id": mutation.objetivo_id}), limit=1):
+            return sync_outcome(mutation, SyncStatus.OBSOLETA, "El registro cambió después de fecha_cliente")
+        return sync_outcome(mutation, SyncStatus.ERROR, "Registro no encontrado")
+    touched[collection].add(updated["lote"])
+    return sync_outcome(mutation, SyncStatus.APLICADA, resultado=jsonable_encoder(updated))
+
+@api_router.post("/sync", response_model=List[SyncOutcome])
+async def sync_mutations(sync: SyncRequest):
+    """Apply a queue of offline mutations; each id_cliente is applied at most once."""
+    unique = {}
+    for mutation in sorted(sync.mutaciones, key=lambda mutation: utc_naive(mutation.fecha_cliente)):
+        unique.setdefault(mutation.id_cliente, mutation)
+    fingerprints = {
+        key: request_fingerprint(mutation.model_dump(exclude={"fecha_cliente"})) for key, mutation in unique.items()
+    }
+    claimed = await reserve_idempotency_keys("sync", list(fingerprints.items()))
+    outcomes = {key: replayed_outcome(unique[key], record, fingerprints[key]) for key, record in claimed.items()}
+    pending = [mutation for key, mutation in unique.items() if key not in claimed]
+
+    touched = defaultdict(set)
+    try:
+        await apply_sync_creates([m for m in pending if m.operacion in SYNC_CREATES], outcomes, touched)
+        for mutation in pending:
+            if mutation.operacion in SYNC_UPDATES:
+                outcomes[mutation.id_cliente] = await apply_sync_update(mutation, touched)
+    except BaseException:
+        await release_idempotency_keys("sync", [m.id_cliente for m in pending if m.id_cliente not in outcomes])
+        raise
+    finally:
+        if touched:
+            await collections_changed(*touched)
+            await lots_written(*itertools.chain.from_iterable(touched.values()))
+            await refresh_lot_kpis(*touched["animals"], *touched["incubation_batches"])
+
+    # Failed mutations release their id so the client can correct and resend them
+    failed = [m.id_cliente for m in pending if outcomes[m.id_cliente].estado == SyncStatus.ERROR]
+    done = [m.id_cliente for m in pending if outcomes[m.id_cliente].estado != SyncStatus.ERROR]
+    if failed:
+        await release_idempotency_keys("sync", failed)
+    if done:
+        await complete_idempotency_keys("sync", [(key, 200, render_json(outcomes[key])) for key in done])
+
+    results, seen = [], set()
+    for mutation in sync.mutaciones:
+        outcome = outcomes[mutation.id_cliente]
+        if mutation.id_cliente in seen and outcome.estado != SyncStatus.ERROR:
+            outcome = outcome.model_copy(update={"estado": SyncStatus.DUPLICADA})
+        seen.add(mutation.id_cliente)
+        results.append(outcome)
+    return results
+
 # Routes - Dashboard
-@api_router.get("/dashboard", response_model=Dashboard)
-async def get_dashboard():
-    # Obtener totales de animales
-    total_animales = await db.animals.count_documents({"estado": "activo"})
-    total_ponedoras = await db.animals.count_documents({"tipo": "ponedora", "estado": "activo"})
-    total_engorde = await db.animals.count_documents({"tipo": "engorde", "estado": "activo"})
-    total_reproductores = await db.animals.count_documents({"tipo": "reproductor", "estado": "activo"})
-    
-    # Obtener recolección de huevos
-    today = date_to_datetime(date.today())
-    huevos_hoy = await db.egg_collections.aggregate([
-        {"$match": {"fecha": today}},
-        {"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}
-    ]).to_list(1)
-    
-    # Obtener huevos del mes
-    from calendar import monthrange
-    start_month = date_to_datetime(date.today().replace(day=1))
-    end_month = date_to_datetime(date.today().replace(day=monthrange(date.today().year, date.today().month)[1]))
-    
-    huevos_mes = await db.egg_collections.aggregate([
-        {"$match": {"fecha": {"$gte": start_month, "$lte": end_month}}},
-        {"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}
+# Each source is read with a single pipeline and the pipelines run
+# concurrently, so the dashboard costs one round trip instead of ten. Egg and
+# balance totals come from the rollup collections.
+def month_bounds(day):
+    start_month = date_to_datetime(day.replace(day=1))
+    end_month = date_to_datetime(day.replace(day=monthrange(day.year, day.month)[1]))
+    return start_month, end_month
+
+DASHBOARD_COLLECTIONS = ("animals", "egg_collections", "incubation_batches", "transactions")
+
+async def dashboard_animals(database):
+    result = await database.animals.aggregate([
+        {"$match": farm_query({"estado": "activo"})},
+        {"$facet": {
+            "por_tipo": [{"$group": {"_id": "$tipo", "total": {"$sum": 1}}}],
+            # Lotes próximos a venta (más de 35 días para engorde)
+            "proximos_venta": [
+                {"$match": {"tipo": "engorde", "edad_dias": {"$gte": 35}}},
+                {"$limit": 5},
+            ],
+        }},
     ]).to_list(1)
-    
-    # Obtener incubaciones activas
-    incubaciones_activas = await db.incubation_batches.count_documents({"estado": "activo"})
-    
-    # Obtener balance del mes
-    balance_mes = await db.transactions.aggregate([
-        {"$match": {"fecha": {"$gte": start_month, "$lte": end_month}}},
-        {"$group": {
-            "_id": "$tipo",
-            "total": {"$sum": "$total"}
-        }}
+    facets = result[0] if result else {"por_tipo": [], "proximos_venta": []}
+    por_tipo = {item["_id"]: item["total"] for item in facets["por_tipo"]}
+    return {
+        "total_animales": sum(por_tipo.values()),
+        "total_ponedoras": por_tipo.get("ponedora", 0),
+        "total_engorde": por_tipo.get("engorde", 0),
+        "total_reproductores": por_tipo.get("reproductor", 0),
+        "lotes_proximos_venta": [Animal(**animal) for animal in facets["proximos_venta"]],
+    }
+
+async def dashboard_egg_collections(database, today, start_month, end_month):
+    totals, ultimas = await asyncio.gather(
+        database.egg_daily_rollups.aggregate([
+            {"$match": farm_query({"fecha": {"$gte": start_month, "$lte": end_month}})},
+            {"$facet": {
+                "hoy": [
+                    {"$match": {"fecha": today}},
+                    {"$group": {"_id": None, "total": {"$sum": "$cantidad"}}},
+                ],
+                "mes": [{"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}],
+            }},
+        ]).to_list(1),
+        database.egg_collections.find(farm_query()).sort("fecha", -1).limit(5).to_list(5),
+    )
+    facets = totals[0] if totals else {"hoy": [], "mes": []}
+    return {
+        "huevos_hoy": facets["hoy"][0]["total"] if facets["hoy"] else 0,
+        "huevos_mes": facets["mes"][0]["total"] if facets["mes"] else 0,
+        "ultimas_recolecciones": [EggCollection(**col) for col in ultimas],
+    }
+
+async def dashboard_incubation(database):
+    return {"incubaciones_activas": await database.incubation_batches.count_documents(farm_query({"estado": "activo"}))}
+
+async def dashboard_transactions(database, start_month):
+    balance_mes = await database.transaction_monthly_rollups.aggregate([
+        {"$match": farm_query({"mes": start_month})},
+        {"$group": {"_id": "$tipo", "total": {"$sum": "$total"}}},
     ]).to_list(2)
-    
-    ingresos_mes = 0
-    egresos_mes = 0
-    for item in balance_mes:
-        if item["_id"] == "ingreso":
-            ingresos_mes = item["total"]
-        elif item["_id"] == "egreso":
-            egresos_mes = item["total"]
-    
-    # Obtener últimas recolecciones
-    ultimas_recolecciones = await db.egg_collections.find().sort("fecha", -1).limit(5).to_list(5)
-    
-    # Obtener lotes próximos a venta (más de 35 días para engorde)
-    lotes_proximos_venta = await db.animals.find({
-        "tipo": "engorde",
-        "edad_dias": {"$gte": 35},
-        "estado": "activo"
-    }).limit(5).to_list(5)
-    
-    return Dashboard(
-        total_animales=total_animales,
-        total_ponedoras=total_ponedoras,
-        total_engorde=total_engorde,
-        total_reproductores=total_reproductores,
-        huevos_hoy=huevos_hoy[0]["total"] if huevos_hoy else 0,
-        huevos_mes=huevos_mes[0]["total"] if huevos_mes else 0,
-        incubaciones_activas=incubaciones_activas,
-        balance_mes=ingresos_mes - egresos_mes,
-        ultimas_recolecciones=[EggCollection(**col) for col in ultimas_recolecciones],
-        lotes_proximos_venta=[Animal(**animal) for animal in lotes_proximos_venta]
+    totales = {item["_id"]: item["total"] for item in balance_mes}
+    return {"balance_mes": totales.get("ingreso", 0) - totales.get("egreso", 0)}
+
+async def dashboard_part(collection, database):
+    today = date.today()
+    start_month, end_month = month_bounds(today)
+    if collection == "animals":
+        return await dashboard_animals(database)
+    if collection == "egg_collections":
+        return await dashboard_egg_collections(database, date_to_datetime(today), start_month, end_month)
+    if collection == "incubation_batches":
+        return await dashboard_incubation(database)
+    return await dashboard_transactions(database, start_month)
+
+async def compute_dashboard(database=None):
+    database = database if database is not None else analytics_db
+    parts = await asyncio.gather(*(dashboard_part(collection, database) for collection in DASHBOARD_COLLECTIONS))
+    fields = {}
+    for part in parts:
+        fields.update(part)
+    return Dashboard(**fields)
+
+@api_router.get("/dashboard", response_model=Dashboard, dependencies=analytics_etag(*DASHBOARD_COLLECTIONS))
+@analytics_cached(*DASHBOARD_COLLECTIONS)
+async def get_dashboard():
+    return await compute_dashboard()
+
+# Live dashboard
+# Subscribers of /api/stream/dashboard share one in-process copy of the
+# dashboard. A write only recomputes the part of the dashboard that reads the
+# written collection and pushes the fields that changed, so N open screens
+# cost one recomputation per write instead of N polling aggregations.
+# With DASHBOARD_CHANGE_STREAM=1 a MongoDB change stream (replica set required)
+# feeds writes made by other workers into the same path. Each farm has its own
+# hub, created on first use.
+DASHBOARD_DEBOUNCE_SECONDS = 0.2
+DASHBOARD_KEEPALIVE_SECONDS = 15
+DASHBOARD_QUEUE_SIZE = 100
+
+class DashboardHub:
+    def __init__(self, farm_id):
+        self.farm_id = farm_id
+        self.state = None
+        self.day = None
+        self.subscribers = set()
+        self.pending = set()
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=DASHBOARD_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            # Nobody is watching: stop tracking so writes cost nothing
+            self.state = None
+
+    async def snapshot(self):
+        async with self.lock:
+            if self.state is None or self.day != date.today():
+                # Deltas follow writes, so the live copy reads the primary
+                self.state = jsonable_encoder(await compute_dashboard(db))
+                self.day = date.today()
+            return self.state
+
+    def schedule(self, *collections):
+        """Coalesce writes arriving within DASHBOARD_DEBOUNCE_SECONDS into one refresh."""
+        if self.state is None:
+            return
+        self.pending.update(c for c in collections if c in DASHBOARD_COLLECTIONS)
+        if self.pending and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        # The flush task may have been scheduled by the change stream watcher
+        farm_context.set(self.farm_id)
+        # schedule() starts no new task while this one runs, so writes that
+        # arrive during a refresh are picked up by the next iteration
+        while self.pending:
+            await asyncio.sleep(DASHBOARD_DEBOUNCE_SECONDS)
+            collections, self.pending = self.pending, set()
+            try:
+                await self.refresh(collections)
+            except Exception:
+                logger.exception("Live dashboard refresh failed")
+
+    async def refresh(self, collections):
+        async with self.lock:
+            if self.state is None:
+                return
+            if self.day != date.today():
+                # Daily and monthly totals roll over at midnight
+                collections = DASHBOARD_COLLECTIONS
+                self.day = date.today()
+            parts = await asyncio.gather(*(dashboard_part(collection, db) for collection in collections))
+            delta = {}
+            for part in parts:
+                for field, value in jsonable_encoder(part).items():
+                    if self.state.get(field) != value:
+                        self.state[field] = delta[field] = value
+        if delta:
+            self.publish(delta)
+
+    def publish(self, delta):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(delta)
+            except asyncio.QueueFull:
+                # A stalled client gets a fresh snapshot when it catches up
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+dashboard_hubs = {}
+
+def dashboard_hub(farm_id=None):
+    farm_id = farm_id or current_farm()
+    if farm_id not in dashboard_hubs:
+        dashboard_hubs[farm_id] = DashboardHub(farm_id)
+    return dashboard_hubs[farm_id]
+
+def sse_event(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+@api_router.get("/stream/dashboard")
+async def stream_dashboard(request: Request):
+    hub = dashboard_hub()
+    queue = hub.subscribe()
+
+    async def events():
+        try:
+            yield sse_event("snapshot", await hub.snapshot())
+            while not await request.is_disconnected():
+                try:
+                    delta = await asyncio.wait_for(queue.get(), timeout=DASHBOARD_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if hub.day != date.today():
+                        hub.schedule(*DASHBOARD_COLLECTIONS)
+                    yield b": keepalive\n\n"
+                    continue
+                if delta is None:
+                    yield sse_event("snapshot", await hub.snapshot())
+                else:
+                    yield sse_event("delta", delta)
+        finally:
+            hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def watch_dashboard_collections():
+    pipeline = [{"$match": {"ns.coll": {"$in": list(DASHBOARD_COLLECTIONS)}}}]
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup") as change_stream:
+                async for change in change_stream:
+                    # Deletes carry only the document key, which holds farm_id
+                    # once the collection is sharded on it
+                    document = change.get("fullDocument") or change.get("documentKey", {})
+                    farm_id = document.get("farm_id")
+                    hubs = [dashboard_hubs[farm_id]] if farm_id in dashboard_hubs else []
+                    if farm_id is None:
+                        hubs = list(dashboard_hubs.values())
+                    for hub in hubs:
+                        hub.schedule(change["ns"]["coll"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Dashboard change stream failed; retrying")
+            await asyncio.sleep(5)
+
+# Routes - Analytics
+# Egg production is bucketed from egg_daily_rollups, which is already summed per
+# day, lot and type. Closed buckets never change unless a late collection is
+# recorded for them, so they are stored in egg_analytics_buckets and only the
+# open bucket (and any evicted one) is recomputed on each request. Buckets hold
+# egg totals only; the live hen count of each lot is joined on every read, so
+# animal writes never leave a stored bucket stale.
+ANALYTICS_UNITS = {
+    AnalyticsGranularity.DIA: "day",
+    AnalyticsGranularity.SEMANA: "week",
+    AnalyticsGranularity.MES: "month",
+}
+
+def bucket_start(day, granularidad):
+    if granularidad == AnalyticsGranularity.SEMANA:
+        day = day - timedelta(days=day.weekday())
+    elif granularidad == AnalyticsGranularity.MES:
+        day = day.replace(day=1)
+    return date_to_datetime(day)
+
+def next_bucket(start, granularidad):
+    if granularidad == AnalyticsGranularity.DIA:
+        return start + timedelta(days=1)
+    if granularidad == AnalyticsGranularity.SEMANA:
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+async def invalidate_egg_analytics(fechas):
+    stale = [
+        farm_query({"granularidad": granularidad.value, "periodo": bucket_start(fecha.date(), granularidad)})
+        for fecha in fechas for granularidad in AnalyticsGranularity
+    ]
+    if stale:
+        # Bumped before the delete, so a reader storing buckets concurrently sees it
+        await bump_versions("egg_analytics_buckets")
+        await db.egg_analytics_buckets.delete_many({"$or": stale})
+
+async def aggregate_egg_buckets(database, granularidad, start, end):
+    date_trunc = {"date": "$fecha", "unit": ANALYTICS_UNITS[granularidad]}
+    if granularidad == AnalyticsGranularity.SEMANA:
+        date_trunc["startOfWeek"] = "monday"
+    rows = await database.egg_daily_rollups.aggregate([
+        {"$match": farm_query({"fecha": {"$gte": start, "$lt": end}})},
+        {"$group": {
+            "_id": {"periodo": {"$dateTrunc": date_trunc}, "lote_origen": "$lote_origen", "tipo": "$tipo"},
+            "cantidad": {"$sum": "$cantidad"},
+            "peso_total": {"$sum": "$peso_total"},
+            "registros": {"$sum": "$registros"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "periodo": "$_id.periodo",
+            "lote_origen": "$_id.lote_origen",
+            "tipo": "$_id.tipo",
+            "cantidad": 1,
+            "peso_total": 1,
+            "registros": 1,
+        }},
+    ]).to_list(None)
+    buckets = defaultdict(list)
+    for row in rows:
+        buckets[row.pop("periodo")].append(row)
+    return buckets
+
+async def laying_hens(lotes):
+    """Live hen count of each laying lot in `lotes`."""
+    rows = await analytics_db.animals.aggregate([
+        {"$match": farm_query({"lote": {"$in": list(lotes)}, "tipo": "ponedora", "estado": "activo"})},
+        {"$group": {"_id": "$lote", "gallinas": {"$sum": "$cantidad"}}},
+    ]).to_list(None)
+    return {row["_id"]: row["gallinas"] for row in rows}
+
+def egg_analytics_point(periodo, row, granularidad, today, gallinas):
+    end = next_bucket(periodo, granularidad)
+    cerrado = end <= today
+    dias = ((end if cerrado else today + timedelta(days=1)) - periodo).days
+    # Buckets stored before hen counts were joined on read still carry one
+    row = {field: value for field, value in row.items() if field != "gallinas"}
+    return EggAnalyticsPoint(
+        periodo=periodo,
+        cerrado=cerrado,
+        peso_promedio_huevo=row["peso_total"] / row["cantidad"] if row["cantidad"] else None,
+        gallinas=gallinas,
+        huevos_por_gallina_dia=row["cantidad"] / (gallinas * dias) if gallinas else None,
+        **row,
+    )
+
+@api_router.get(
+    "/analytics/eggs",
+    response_model=List[EggAnalyticsPoint],
+    dependencies=analytics_etag("egg_collections", "animals"),
+)
+@analytics_cached("egg_collections", "animals")
+async def get_egg_analytics(
+    granularidad: AnalyticsGranularity = AnalyticsGranularity.DIA,
+    desde: Optional[date] = Query(None, description="Por defecto, 90 días antes de `hasta`"),
+    hasta: Optional[date] = Query(None, description="Por defecto, hoy"),
+    lote_origen: Optional[str] = None,
+    tipo: Optional[EggType] = None,
+):
+    """Egg production per period, lot and type; the range is widened to whole periods."""
+    today = date_to_datetime(date.today())
+    hasta = hasta or today.date()
+    desde = desde or hasta - timedelta(days=90)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="`desde` debe ser anterior a `hasta`")
+    start = bucket_start(desde, granularidad)
+    end = next_bucket(bucket_start(hasta, granularidad), granularidad)
+    open_start = bucket_start(today.date(), granularidad)
+
+    cached_buckets = await db.egg_analytics_buckets.find(
+        farm_query({"granularidad": granularidad.value, "periodo": {"$gte": start, "$lt": min(end, open_start)}})
+    ).to_list(None)
+    buckets = {bucket["periodo"]: bucket["filas"] for bucket in cached_buckets}
+
+    periodos = []
+    periodo = start
+    while periodo < end:
+        periodos.append(periodo)
+        periodo = next_bucket(periodo, granularidad)
+    missing = [periodo for periodo in periodos if periodo not in buckets]
+    closed = [periodo for periodo in missing if periodo < open_start]
+    current = [periodo for periodo in missing if periodo >= open_start]
+    computed = {}
+    if current:
+        computed.update(await aggregate_egg_buckets(
+            analytics_db, granularidad, current[0], next_bucket(current[-1], granularidad)
+        ))
+    if closed:
+        # Closed buckets are stored for good, so they are computed on the
+        # primary where a lagging secondary cannot freeze stale totals
+        version = await current_etag(["egg_analytics_buckets"])
+        computed.update(await aggregate_egg_buckets(
+            db, granularidad, closed[0], next_bucket(closed[-1], granularidad)
+        ))
+        await db.egg_analytics_buckets.bulk_write([
+            UpdateOne(
+                farm_query({"granularidad": granularidad.value, "periodo": periodo}),
+                {"$set": {"filas": computed.get(periodo, [])}},
+                upsert=True,
+            )
+            for periodo in closed
+        ], ordered=False)
+        # A late collection evicted some of them meanwhile; drop what was stored
+        if await current_etag(["egg_analytics_buckets"]) != version:
+            await db.egg_analytics_buckets.delete_many(
+                farm_query({"granularidad": granularidad.value, "periodo": {"$in": closed}})
+            )
+    for periodo in missing:
+        buckets[periodo] = computed.get(periodo, [])
+
+    rows = [
+        (periodo, row)
+        for periodo in periodos
+        for row in buckets[periodo]
+        if (lote_origen is None or row["lote_origen"] == lote_origen) and (tipo is None or row["tipo"] == tipo)
+    ]
+    gallinas = await laying_hens({row["lote_origen"] for _, row in rows}) if rows else {}
+    return [
+        egg_analytics_point(periodo, row, granularidad, today, gallinas.get(row["lote_origen"]))
+        for periodo, row in rows
+    ]
+
+# Routes - Search
+# Full-text search runs one $text query per collection concurrently. Lot-code
+# autocomplete is served from an in-memory prefix tree that each write extends
+# and that is rebuilt from the database at startup.
+SEARCH_COLLECTIONS = ("animals", "incubation_batches", "egg_collections", "transactions")
+LOT_FIELDS = {
+    "animals": "lote",
+    "incubation_batches": "lote",
+    "egg_collections": "lote_origen",
+    "feed_calculations": "lote",
+    "transactions": "lote",
+}
+
+class LotTrie:
+    """Case-insensitive prefix tree of lot codes."""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def add(self, code):
+        if not code:
+            return
+        node = self.root
+        for char in code.lower():
+            node = node.setdefault(char, {})
+        # The None key holds the codes that end at this node
+        codes = node.setdefault(None, set())
+        if code not in codes:
+            codes.add(code)
+            self.size += 1
+
+    def walk(self, node):
+        if None in node:
+            yield from sorted(node[None])
+        for char in sorted(key for key in node if key is not None):
+            yield from self.walk(node[char])
+
+    def complete(self, prefix, limit):
+        node = self.root
+        for char in prefix.lower():
+            node = node.get(char)
+            if node is None:
+                return []
+        return list(itertools.islice(self.walk(node), limit))
+
+# farm_id -> LotTrie
+lot_indexes = defaultdict(LotTrie)
+
+async def rebuild_lot_index():
+    global lot_indexes
+    # Egg lots are read from the rollups, which hold one document per lot and day
+    sources = [("animals", "lote"), ("incubation_batches", "lote"), ("feed_calculations", "lote"),
+               ("egg_daily_rollups", "lote_origen")]
+    codes = await asyncio.gather(*(
+        db[collection].aggregate([{"$group": {"_id": {"farm_id": "$farm_id", "lote": f"${field}"}}}]).to_list(None)
+        for collection, field in sources
+    ))
+    tries = defaultdict(LotTrie)
+    for code in itertools.chain.from_iterable(codes):
+        tries[code["_id"].get("farm_id", DEFAULT_FARM_ID)].add(code["_id"].get("lote"))
+    lot_indexes = tries
+    return sum(trie.size for trie in tries.values())
+
+@api_router.get("/search", response_model=List[SearchHit])
+async def search(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    async def search_collection(collection):
+        docs = await db[collection].find(
+            farm_query({"$text": {"$search": q}}), {"_id": 0, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(limit)
+        return [{"coleccion": collection, "score": doc.pop("score"), "documento": doc} for doc in docs]
+
+    results = await asyncio.gather(*(search_collection(collection) for collection in SEARCH_COLLECTIONS))
+    hits = sorted(itertools.chain.from_iterable(results), key=lambda hit: hit["score"], reverse=True)
+    return json_response(hits[:limit])
+
+@api_router.get("/search/lotes", response_model=List[str])
+async def autocomplete_lots(prefix: str = "", limit: int = Query(10, ge=1, le=100)):
+    return lot_indexes[current_farm()].complete(prefix, limit)
+
+# Routes - Lots
+# Lots are referenced by free-text code from several collections. A lot's
+# summary is assembled in one aggregation: $documents seeds the requested codes
+# and one $lookup per collection pulls in the related data. Results are cached
+# under a per-lot tag that any write touching that lot evicts.
+def lot_tag(lote):
+    return f"lote:{lote}"
+
+async def lots_written(*lotes):
+    lotes = [lote for lote in lotes if lote]
+    for lote in lotes:
+        lot_indexes[current_farm()].add(lote)
+    if lotes:
+        await invalidate_cache(*(lot_tag(lote) for lote in lotes))
+
+def lot_summary_pipeline(lotes):
+    farm = {"$match": farm_query()}
+    return [
+        {"$documents": [{"lote": lote} for lote in lotes]},
+        {"$lookup": {
+            "from": "animals", "localField": "lote", "foreignField": "lote", "as": "animales",
+            "pipeline": [farm, {"$project": {"_id": 0}}],
+        }},
+        {"$lookup": {
+            "from": "egg_daily_rollups", "localField": "lote", "foreignField": "lote_origen", "as": "huevos",
+            "pipeline": [farm, {"$group": {"_id": None, "cantidad": {"$sum": "$cantidad"}, "peso_total": {"$sum": "$peso_total"}}}],
+        }},
+        {"$lookup": {
+            "from": "feed_calculations", "localField": "lote", "foreignField": "lote", "as": "alimento",
+            "pipeline": [
+                farm,
+                {"$sort": {"fecha_calculo": -1}},
+                {"$group": {"_id": None, "calculos": {"$sum": 1}, "ultimo_calculo": {"$first": "$$ROOT"}}},
+                {"$unset": "ultimo_calculo._id"},
+            ],
+        }},
+        {"$lookup": {
+            "from": "incubation_batches", "localField": "lote", "foreignField": "lote", "as": "incubaciones",
+            "pipeline": [farm, {"$project": {"_id": 0}}],
+        }},
+        {"$lookup": {
+            "from": "transactions", "localField": "lote", "foreignField": "lote", "as": "transacciones",
+            "pipeline": [farm, {"$facet": {
+                "totales": [{"$group": {"_id": "$tipo", "total": {"$sum": "$total"}}}],
+                "ultimas": [{"$sort": {"fecha": -1}}, {"$limit": 5}, {"$project": {"_id": 0}}],
+            }}],
+        }},
+    ]
+
+async def lot_summaries(lotes):
+    rows, archived = await asyncio.gather(
+        db.aggregate(lot_summary_pipeline(lotes)).to_list(None),
+        # Totals of archived transactions; the latest ones are still hot
+        db[ARCHIVES["transactions"][0]].aggregate([
+            {"$match": farm_query({"lote": {"$in": lotes}})},
+            {"$group": {"_id": {"lote": "$lote", "tipo": "$tipo"}, "total": {"$sum": "$total"}}},
+        ]).to_list(None),
+    )
+    archived_totals = {(item["_id"]["lote"], item["_id"]["tipo"]): item["total"] for item in archived}
+    summaries = []
+    for row in rows:
+        transacciones = row["transacciones"][0] if row["transacciones"] else {"totales": [], "ultimas": []}
+        totales = {item["_id"]: item["total"] for item in transacciones["totales"]}
+        for tipo in ("ingreso", "egreso"):
+            totales[tipo] = totales.get(tipo, 0.0) + archived_totals.get((row["lote"], tipo), 0.0)
+        if not (row["animales"] or row["huevos"] or row["alimento"] or row["incubaciones"] or transacciones["ultimas"]
+                or any(totales.values())):
+            continue
+        huevos = row["huevos"][0] if row["huevos"] else {}
+        alimento = row["alimento"][0] if row["alimento"] else {}
+        summaries.append({
+            "lote": row["lote"],
+            "total_aves": sum(a["cantidad"] for a in row["animales"] if a.get("estado") == "activo"),
+            "animales": row["animales"],
+            "huevos": {"cantidad": huevos.get("cantidad", 0), "peso_total": huevos.get("peso_total", 0.0)},
+            "alimento": {"calculos": alimento.get("calculos", 0), "ultimo_calculo": alimento.get("ultimo_calculo")},
+            "incubaciones": row["incubaciones"],
+            "transacciones": {
+                "total_ingresos": totales.get("ingreso", 0.0),
+                "total_egresos": totales.get("egreso", 0.0),
+                "ultimas": transacciones["ultimas"],
+            },
+        })
+    return summaries
+
+@api_router.get("/lots", response_model=List[LotSummary])
+@cached("animals", "egg_collections", "feed_calculations", "incubation_batches", "transactions")
+async def get_lots(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+):
+    """Summaries of the lots registered in `animals`, ordered by lot code."""
+    query = farm_query()
+    if after:
+        try:
+            query["lote"] = {"$gt": base64.urlsafe_b64decode(after + "=" * (-len(after) % 4)).decode("utf-8")}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    codes = await db.animals.aggregate([
+        {"$match": query},
+        {"$sort": {"lote": 1}},
+        {"$group": {"_id": "$lote"}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit + 1},
+    ]).to_list(limit + 1)
+    lotes = [code["_id"] for code in codes]
+    if len(lotes) > limit:
+        lotes = lotes[:limit]
+        response.headers["X-Next-Cursor"] = base64.urlsafe_b64encode(lotes[-1].encode()).decode().rstrip("=")
+    return json_response(await lot_summaries(lotes) if lotes else [], response)
+
+@api_router.get("/lots/{lote}/summary", response_model=LotSummary)
+@cached(tags=lambda params: [lot_tag(params["lote"])], versions=tuple(LOT_FIELDS))
+async def get_lot_summary(lote: str):
+    summaries = await lot_summaries([lote])
+    if not summaries:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return json_response(summaries[0])
+
+# Routes - KPIs
+# Hatch rate, mortality and feed conversion are kept per lot in `lot_kpis`. A
+# write that changes an input, offline sync included, recomputes only the lots
+# it touched, from a few indexed reads of that lot's animals, incubation
+# batches and latest feed calculation; the recalcular_kpis job rebuilds every
+# lot to pick up writes made outside the API. Breed comparisons are computed on
+# read from the lot documents.
+KPI_METRICS = ("tasa_eclosion", "mortalidad", "conversion_alimenticia")
+
+async def compute_lot_kpis(lote):
+    animals, batches, feed = await asyncio.gather(
+        db.animals.find(
+            farm_query({"lote": lote}),
+            {"_id": 0, "raza": 1, "cantidad": 1, "bajas": 1, "vendidos": 1, "transferidos": 1},
+        ).to_list(None),
+        db.incubation_batches.find(
+            farm_query({"lote": lote}),
+            {"_id": 0, "raza": 1, "estado": 1, "cantidad_huevos": 1, "pollitos_eclosionados": 1},
+        ).to_list(None),
+        db.feed_calculations.find(
+            farm_query({"lote": lote}),
+            {"_id": 0, "tipo_animal": 1, "edad_dias": 1, "peso_promedio": 1},
+        ).sort([("fecha_calculo", -1), ("id", -1)]).limit(1).to_list(1),
+    )
+    if not (animals or batches or feed):
+        return None
+
+    aves = defaultdict(int)
+    for animal in animals:
+        salidas = animal.get("bajas", 0) + animal.get("vendidos", 0) + animal.get("transferidos", 0)
+        aves[animal["raza"]] += animal["cantidad"] + salidas
+    # Batches still in the incubator have no result yet
+    hatched = [b for b in batches if b["estado"] in ("eclosionado", "fallido") or b.get("pollitos_eclosionados")]
+    raza = max(aves, key=aves.get) if aves else (batches[0]["raza"] if batches else None)
+    huevos = sum(b["cantidad_huevos"] for b in hatched)
+    pollitos = sum(b.get("pollitos_eclosionados", 0) for b in hatched)
+    aves_iniciales = sum(aves.values())
+    bajas = sum(animal.get("bajas", 0) for animal in animals)
+    conversion = None
+    if feed and feed[0]["peso_promedio"]:
+        # Feed eaten per bird over its whole life, per kg of live weight
+        calc = feed[0]
+        bands = FEED_CONSUMPTION_TABLE[AnimalType(calc["tipo_animal"])]
+        conversion = lifetime_consumption(bands, calc["edad_dias"]) / calc["peso_promedio"]
+    return LotKpis(
+        lote=lote,
+        raza=raza,
+        huevos_incubados=huevos,
+        pollitos_eclosionados=pollitos,
+        tasa_eclosion=pollitos / huevos if huevos else None,
+        aves_iniciales=aves_iniciales,
+        bajas=bajas,
+        mortalidad=bajas / aves_iniciales if aves_iniciales else None,
+        conversion_alimenticia=conversion,
+        updated_at=datetime.utcnow(),
+    )
+
+async def refresh_lot_kpis(*lotes):
+    lotes = {lote for lote in lotes if lote}
+    for lote in lotes:
+        kpis = await compute_lot_kpis(lote)
+        if kpis is None:
+            await db.lot_kpis.delete_one(farm_query({"lote": lote}))
+        else:
+            await db.lot_kpis.replace_one(farm_query({"lote": lote}), farm_query(kpis.model_dump()), upsert=True)
+    if lotes:
+        # /api/kpis depends on lot_kpis itself, which changes after its sources
+        await collections_changed("lot_kpis")
+
+async def rebuild_kpis():
+    """Recompute the KPIs of every lot of every farm."""
+    lots = 0
+    sources = [("animals", "lote"), ("incubation_batches", "lote"), ("feed_calculations", "lote")]
+    codes = await asyncio.gather(*(
+        db[collection].aggregate([{"$group": {"_id": {"farm_id": "$farm_id", "lote": f"${field}"}}}]).to_list(None)
+        for collection, field in sources
+    ))
+    lots_by_farm = defaultdict(set)
+    for code in itertools.chain.from_iterable(codes):
+        lots_by_farm[code["_id"].get("farm_id", DEFAULT_FARM_ID)].add(code["_id"].get("lote"))
+    for farm_id, lotes in lots_by_farm.items():
+        with farm_scope(farm_id):
+            await refresh_lot_kpis(*lotes)
+            # Lots left without any source document
+            await db.lot_kpis.delete_many(farm_query({"lote": {"$nin": list(lotes)}}))
+        lots += len(lotes)
+    return lots
+
+def breed_stats(lots, metric, pooled):
+    values = np.array([lot[metric] for lot in lots if lot[metric] is not None], dtype=np.float64)
+    if not values.size:
+        return {"valor": pooled}
+    p25, p50, p75 = np.percentile(values, [25, 50, 75])
+    return {"valor": pooled, "p25": float(p25), "p50": float(p50), "p75": float(p75)}
+
+def breed_kpis(lots):
+    by_breed = defaultdict(list)
+    for lot in lots:
+        if lot["raza"]:
+            by_breed[lot["raza"]].append(lot)
+    razas = []
+    for raza, breed_lots in sorted(by_breed.items()):
+        huevos = sum(lot["huevos_incubados"] for lot in breed_lots)
+        aves = sum(lot["aves_iniciales"] for lot in breed_lots)
+        conversions = [lot["conversion_alimenticia"] for lot in breed_lots if lot["conversion_alimenticia"] is not None]
+        pooled = {
+            "tasa_eclosion": sum(lot["pollitos_eclosionados"] for lot in breed_lots) / huevos if huevos else None,
+            "mortalidad": sum(lot["bajas"] for lot in breed_lots) / aves if aves else None,
+            "conversion_alimenticia": float(np.mean(conversions)) if conversions else None,
+        }
+        razas.append({
+            "raza": raza,
+            "lotes": len(breed_lots),
+            **{metric: breed_stats(breed_lots, metric, pooled[metric]) for metric in KPI_METRICS},
+        })
+    # Rank each breed's value among the breeds that have one
+    for metric in KPI_METRICS:
+        values = np.sort([raza[metric]["valor"] for raza in razas if raza[metric]["valor"] is not None])
+        for raza in razas:
+            valor = raza[metric]["valor"]
+            if valor is not None:
+                raza[metric]["percentil"] = float(100 * np.searchsorted(values, valor, side="right") / values.size)
+    return razas
+
+@api_router.get("/kpis", response_model=KpiReport, dependencies=[collection_etag("lot_kpis")])
+@cached("lot_kpis")
+async def get_kpis(raza: Optional[str] = None, lote: Optional[str] = None):
+    """Per-lot KPIs and, per breed, pooled values, lot percentiles and the rank among breeds."""
+    lots = await db.lot_kpis.find(farm_query(), model_projection(LotKpis)).sort("lote", 1).to_list(None)
+    # Breeds are always compared against the whole farm
+    razas = breed_kpis(lots)
+    return json_response({
+        "lotes": [
+            lot for lot in lots
+            if (raza is None or lot["raza"] == raza) and (lote is None or lot["lote"] == lote)
+        ],
+        "razas": [breed for breed in razas if raza is None or breed["raza"] == raza],
+    })
+
+# Routes - Export
+# Whole collections, archived months included (see tiered_find()), are
+# exported oldest first straight from Motor cursors:
+# every EXPORT_BATCH_SIZE documents become one CSV chunk or one Parquet row
+# group and are sent before the next batch is read, so memory stays bounded
+# whatever the size of the export. The response has no Content-Length and goes
+# out with chunked transfer encoding.
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "50000"))
+EXPORTS = {
+    ExportCollection.ANIMALS: (Animal, "fecha_ingreso"),
+    ExportCollection.INCUBATION_BATCHES: (IncubationBatch, "fecha_incubacion"),
+    ExportCollection.EGG_COLLECTIONS: (EggCollection, "fecha"),
+    ExportCollection.FEED_CALCULATIONS: (FeedCalculation, "fecha_calculo"),
+    ExportCollection.TRANSACTIONS: (Transaction, "fecha"),
+}
+
+async def cursor_batches(cursor, size):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def csv_chunk(fields, rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows([csv_value(row.get(field)) for field in fields] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+async def export_csv(cursor, fields):
+    yield csv_chunk(fields, [], header=True)
+    async for batch in cursor_batches(cursor, EXPORT_BATCH_SIZE):
+        yield csv_chunk(fields, batch)
+
+def parquet_type(annotation):
+    # Optional[X] -> X; the column is nullable either way
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    if args:
+        annotation = args[0]
+    if issubclass(annotation, Enum):
+        return pa.string()
+    return {str: pa.string(), int: pa.int64(), float: pa.float64(), datetime: pa.timestamp("ms")}[annotation]
+
+def parquet_schema(model):
+    return pa.schema([(name, parquet_type(field.annotation)) for name, field in model.model_fields.items()])
+
+class ParquetChunks:
+    """Write-only file object that hands back the Parquet bytes written so far."""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+async def export_parquet(cursor, model):
+    sink = ParquetChunks()
+    schema = parquet_schema(model)
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write_row_group(batch):
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+    async for batch in cursor_batches(cursor, EXPORT_BATCH_SIZE):
+        # Encoding a row group is CPU-bound; keep it off the event loop
+        await asyncio.to_thread(write_row_group, batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+@api_router.get("/export/{coleccion}", response_class=StreamingResponse)
+async def export_collection(
+    coleccion: ExportCollection,
+    formato: ExportFormat = ExportFormat.CSV,
+    desde: Optional[date] = Query(None, description="Fecha inicial, incluida"),
+    hasta: Optional[date] = Query(None, description="Fecha final, incluida"),
+):
+    """Stream every document of `coleccion` in the date range as CSV or Parquet."""
+    if formato == ExportFormat.PARQUET and pa is None:
+        raise HTTPException(status_code=501, detail="Exportación Parquet no disponible: falta pyarrow")
+    model, sort_field = EXPORTS[coleccion]
+    cursor = tiered_find(
+        coleccion.value, sort_field, farm_query(date_range_query(sort_field, desde, hasta)), model_projection(model),
+        [(sort_field, 1), ("id", 1)], batch_size=min(EXPORT_BATCH_SIZE, 10000),
+    )
+    filename = "_".join([coleccion.value, *(str(day) for day in (desde, hasta) if day)])
+    if formato == ExportFormat.PARQUET:
+        body, media_type = export_parquet(cursor, model), "application/vnd.apache.parquet"
+    else:
+        body, media_type = export_csv(cursor, list(model.model_fields)), "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{formato.value}"'},
     )
 
+# Background jobs
+# Periodic jobs run inside every worker, but a job marked `distributed` first
+# takes a lease in `job_locks` that lasts one interval, so across all workers it
+# runs at most once per interval. Jobs that only touch process-local state
+# (the lot index, an in-memory cache) run in every worker.
+JOBS_ENABLED = os.environ.get("JOBS_ENABLED", "1") == "1"
+INCUBATION_GRACE_DAYS = int(os.environ.get("INCUBATION_GRACE_DAYS", "2"))
+
+class Job:
+    def __init__(self, name, func, interval, distributed):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.distributed = distributed
+        self.metrics = {
+            "runs": 0,
+            "failures": 0,
+            "skipped": 0,
+            "last_started": None,
+            "last_duration_seconds": None,
+            "last_documents": None,
+            "total_documents": 0,
+        }
+
+class JobScheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.tasks = []
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def job(self, name, interval, distributed=True):
+        def decorator(func):
+            self.jobs[name] = Job(name, func, interval, distributed)
+            return func
+        return decorator
+
+    async def acquire(self, job):
+        now = datetime.utcnow()
+        try:
+            await db.job_locks.find_one_and_update(
+                {"_id": job.name, "locked_until": {"$lte": now}},
+                {"$set": {"owner": self.owner, "locked_until": now + timedelta(seconds=job.interval)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease exists and has not expired: another worker ran it
+            return False
+
+    async def run(self, job):
+        if job.distributed and not await self.acquire(job):
+            job.metrics["skipped"] += 1
+            return
+        started = monotonic()
+        job.metrics["last_started"] = datetime.utcnow()
+        try:
+            documents = await job.func() or 0
+        except Exception:
+            job.metrics["failures"] += 1
+            logger.exception("Job %s failed", job.name)
+            return
+        finally:
+            job.metrics["runs"] += 1
+            job.metrics["last_duration_seconds"] = monotonic() - started
+        job.metrics["last_documents"] = documents
+        job.metrics["total_documents"] += documents
+
+    async def loop(self, job):
+        while True:
+            await self.run(job)
+            await asyncio.sleep(job.interval)
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.loop(job)) for job in self.jobs.values()]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+scheduler = JobScheduler()
+
+@scheduler.job("actualizar_edades", interval=int(os.environ.get("JOB_AGES_INTERVAL", "3600")))
+async def advance_animal_ages():
+    """Recompute edad_dias of active lots from their age at fecha_ingreso."""
+    modified = 0
+    for farm_id in await db.animals.distinct("farm_id", {"estado": "activo"}):
+        with farm_scope(farm_id):
+            result = await db.animals.update_many(farm_query({"estado": "activo"}), [
+                # Lots created before edad_ingreso_dias existed never aged, so their
+                # stored edad_dias is still the age they entered with
+                {"$set": {"edad_ingreso_dias": {"$ifNull": ["$edad_ingreso_dias", "$edad_dias"]}}},
+                {"$set": {"edad_dias": {"$add": ["$edad_ingreso_dias", {"$max": [0, {"$dateDiff": {
+                    "startDate": "$fecha_ingreso", "endDate": "$$NOW", "unit": "day",
+                }}]}]}}},
+            ])
+            if result.modified_count:
+                await collections_changed("animals")
+                await lots_written(*await db.animals.distinct("lote", farm_query({"estado": "activo"})))
+            modified += result.modified_count
+    return modified
+
+@scheduler.job("cerrar_incubaciones_vencidas", interval=int(os.environ.get("JOB_INCUBATION_INTERVAL", "3600")))
+async def close_overdue_incubations():
+    """Close active batches INCUBATION_GRACE_DAYS past their expected hatch date."""
+    overdue = {
+        "estado": "activo",
+        "fecha_eclosion_esperada": {"$lt": datetime.utcnow() - timedelta(days=INCUBATION_GRACE_DAYS)},
+    }
+    modified = 0
+    for farm_id in await db.incubation_batches.distinct("farm_id", overdue):
+        with farm_scope(farm_id):
+            lotes = await db.incubation_batches.distinct("lote", farm_query(overdue))
+            result = await db.incubation_batches.update_many(farm_query(overdue), [
+                {"$set": {
+                    "estado": {"$cond": [{"$gt": ["$pollitos_eclosionados", 0]}, "eclosionado", "fallido"]},
+                    "updated_at": "$$NOW",
+                }},
+            ])
+            await collections_changed("incubation_batches")
+            await lots_written(*lotes)
+            await refresh_lot_kpis(*lotes)
+            modified += result.modified_count
+    return modified
+
+@scheduler.job(
+    "precalentar_dashboard",
+    interval=int(os.environ.get("JOB_DASHBOARD_INTERVAL", "60")),
+    distributed=isinstance(cache, RedisCache),
+)
+async def prewarm_dashboard():
+    """Store a freshly computed dashboard of every farm in the read cache.
+
+    The body is computed on the primary and only stored if no write landed
+    while it was computed; a write that lands during the set evicts it again.
+    Nothing reads the entry when the dashboard is not cached, so the job then
+    does nothing.
+    """
+    if ANALYTICS_READ_PREFERENCE != "primary":
+        return 0
+    farm_ids = await db.collection_versions.distinct("farm_id")
+    for farm_id in farm_ids:
+        with farm_scope(farm_id):
+            version = await current_etag(DASHBOARD_COLLECTIONS)
+            body = render_json(await compute_dashboard(db))
+            tags = [farm_scoped(collection) for collection in DASHBOARD_COLLECTIONS]
+            await cache_if_unchanged(
+                cache_key("get_dashboard", {}), pack_cached({}, body), tags, DASHBOARD_COLLECTIONS, version
+            )
+    return len(farm_ids)
+
+@scheduler.job("archivar_meses_cerrados", interval=int(os.environ.get("JOB_ARCHIVE_INTERVAL", "86400")))
+async def archive_months():
+    """Move months past ARCHIVE_HOT_MONTHS to the archive tier."""
+    return await archive_closed_months()
+
+@scheduler.job("recalcular_kpis", interval=int(os.environ.get("JOB_KPI_INTERVAL", "3600")))
+async def recompute_kpis():
+    """Rebuild lot_kpis, including lots changed outside the API."""
+    return await rebuild_kpis()
+
+@scheduler.job("reconstruir_indice_lotes", interval=int(os.environ.get("JOB_LOT_INDEX_INTERVAL", "600")), distributed=False)
+async def refresh_lot_index():
+    """Pick up lots created by other workers."""
+    return await rebuild_lot_index()
+
 # Health check
 @api_router.get("/health")
 async def health_check():
     return {"status": "healthy", "app": "Gallinapp", "version": "1.0"}
 
+# Admin endpoints - Query plans
+@api_router.get("/admin/indexes/explain")
+async def explain_indexes():
+    report = await explain_query_shapes()
+    collscans = sorted(name for name, shape in report.items() if shape["collscan"])
+    return {"shapes": report, "collscans": collscans, "ok": not collscans}
+
+# Admin endpoints - Cache
+@api_router.get("/admin/cache")
+async def cache_status():
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    return {
+        "backend": cache.backend,
+        "entries": await cache.size(),
+        "hits": cache_stats["hits"],
+        "misses": cache_stats["misses"],
+        "hit_ratio": cache_stats["hits"] / lookups if lookups else 0.0,
+    }
+
+# Admin endpoints - Jobs
+@api_router.get("/admin/jobs")
+async def jobs_status():
+    return {
+        "enabled": JOBS_ENABLED,
+        "owner": scheduler.owner,
+        "jobs": {
+            name: {"interval_seconds": job.interval, "distributed": job.distributed, **job.metrics}
+            for name, job in scheduler.jobs.items()
+        },
+    }
+
 # Admin endpoints - Clean database
 @api_router.delete("/admin/clean-database")
 async def clean_database():
-    """Clean all data from the database - USE WITH CAUTION"""
+    """Clean all data of the current farm from the database - USE WITH CAUTION"""
     try:
-        # Delete all records from all collections
-        await db.animals.delete_many({})
-        await db.incubation_batches.delete_many({})
-        await db.egg_collections.delete_many({})
-        await db.feed_calculations.delete_many({})
-        await db.transactions.delete_many({})
+        # Lot summaries are cached under per-lot tags, so collect the codes first
+        trie = lot_indexes[current_farm()]
+        lotes = set(trie.walk(trie.root)) | set(await db.transactions.distinct("lote", farm_query()))
+        
+        # Delete all records of the farm from all collections
+        await db.animals.delete_many(farm_query())
+        await db.incubation_batches.delete_many(farm_query())
+        await db.egg_collections.delete_many(farm_query())
+        await db.feed_calculations.delete_many(farm_query())
+        await db.transactions.delete_many(farm_query())
+        # Balance, dashboard and analytics read the rollups, not the raw collections
+        await db.egg_daily_rollups.delete_many(farm_query())
+        await db.transaction_monthly_rollups.delete_many(farm_query())
+        await db.egg_analytics_buckets.delete_many(farm_query())
+        await db.lot_kpis.delete_many(farm_query())
+        # List routes and exports also read the archive tier
+        for collection in ARCHIVES:
+            await delete_archive(collection)
+        # Buffered readings would otherwise land after the delete
+        await telemetry_buffer.flush()
+        await db.incubation_telemetry.delete_many({"meta.farm_id": current_farm()})
+        await db.incubation_telemetry_1m.delete_many(farm_query())
+        await db.incubation_telemetry_1h.delete_many(farm_query())
+        await db.incubation_alerts.delete_many(farm_query())
+        await collections_changed(
+            "animals", "incubation_batches", "egg_collections", "feed_calculations", "transactions", "lot_kpis",
+        )
+        await invalidate_cache(*(lot_tag(lote) for lote in lotes if lote))
+        await rebuild_lot_index()
         
         # Get counts to verify cleanup
         counts = {
-            "animals": await db.animals.count_documents({}),
-            "incubation_batches": await db.incubation_batches.count_documents({}),
-            "egg_collections": await db.egg_collections.count_documents({}),
-            "feed_calculations": await db.feed_calculations.count_documents({}),
-            "transactions": await db.transactions.count_documents({})
+            "animals": await db.animals.count_documents(farm_query()),
+            "incubation_batches": await db.incubation_batches.count_documents(farm_query()),
+            "egg_collections": await db.egg_collections.count_documents(farm_query()),
+            "feed_calculations": await db.feed_calculations.count_documents(farm_query()),
+            "transactions": await db.transactions.count_documents(farm_query()),
+            **{
+                ARCHIVES[collection][0]: await db[ARCHIVES[collection][0]].count_documents(farm_query())
+                for collection in ARCHIVES
+            },
+            "incubation_telemetry": await db.incubation_telemetry.count_documents({"meta.farm_id": current_farm()}),
+            "incubation_alerts": await db.incubation_alerts.count_documents(farm_query()),
         }
         
         return {
@@ -471,6 +3810,10 @@ async def clean_database():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error cleaning database: {str(e)}")
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -480,8 +3823,11 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -489,6 +3835,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+background_tasks = set()
+
+async def startup():
+    try:
+        await warm_up_connections()
+    except Exception:
+        logger.exception("MongoDB connection warm-up failed")
+    await ensure_indexes()
+    await rebuild_lot_index()
+    background_tasks.add(asyncio.create_task(measure_event_loop_lag()))
+    background_tasks.add(asyncio.create_task(telemetry_buffer.run()))
+    if DASHBOARD_CHANGE_STREAM:
+        background_tasks.add(asyncio.create_task(watch_dashboard_collections()))
+    if JOBS_ENABLED:
+        scheduler.start()
+
+async def shutdown():
+    scheduler.stop()
+    for task in background_tasks:
+        task.cancel()
+    # Readings acknowledged but not yet written
+    await telemetry_buffer.flush()
+    client.close()
@@ -240,6 +240,42 @@ def test_incubation_system():
     print("✅ Incubation system tests passed")
     return True
 
+def test_incubation_telemetry():
+    print_separator("Testing Incubation Telemetry")
+    
+    batch_id = created_ids["incubation"]
+    now = datetime.utcnow().replace(microsecond=0)
+    # Setpoints after test_incubation_system: 38.0 °C, 67 % humedad
+    lecturas = [
+        {"ts": (now - timedelta(seconds=30 - 5 * i)).isoformat(), "temperatura": 38.0, "humedad": 67.0}
+        for i in range(5)
+    ]
+    lecturas[-1]["temperatura"] = 40.0
+    response = requests.post(f"{API_URL}/incubation/{batch_id}/telemetry", json={"lecturas": lecturas})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 202
+    assert response.json()["aceptadas"] == 5
+    assert [alerta["variable"] for alerta in response.json()["alertas"]] == ["temperatura"]
+    assert response.json()["alertas"][0]["abierta"]
+    
+    # Back in range closes the alert
+    lectura = {"ts": now.isoformat(), "temperatura": 38.1, "humedad": 67.0}
+    response = requests.post(f"{API_URL}/incubation/{batch_id}/telemetry", json={"lecturas": [lectura]})
+    assert response.status_code == 202
+    assert not response.json()["alertas"][0]["abierta"]
+    
+    # Readings reach the charts after the buffer flushes
+    time.sleep(3)
+    response = requests.get(f"{API_URL}/incubation/{batch_id}/telemetry", params={"resolucion": "1m"})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert sum(point["lecturas"] for point in response.json()) == 6
+    assert max(point["temperatura_max"] for point in response.json()) == 40.0
+    
+    print("✅ Incubation telemetry tests passed")
+    return True
+
 def test_egg_collection():
     print_separator("Testing Egg Collection")
     
@@ -330,6 +366,39 @@ def test_feed_calculator():
     print("✅ Feed calculator tests passed")
     return True
 
+def test_feed_plan():
+    print_separator("Testing Feed Plan")
+    
+    # An engorde lot of 10 birds at 12 days crosses from Inicio (25g) into
+    # Crecimiento (100g) on day 14, i.e. the third day of the horizon
+    plan_request = {
+        "lotes": [{"lote": "Plan-E1", "tipo_animal": "engorde", "cantidad_animales": 10, "edad_dias": 12}],
+        "horizonte_dias": 4,
+        "precio_alimento_kg": 0.6,
+        "detalle_diario": True
+    }
+    response = requests.post(f"{API_URL}/feed-calculator/plan", json=plan_request)
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    result = response.json()
+    expected_daily = [0.25, 0.25, 1.0, 1.0]
+    assert all(abs(a - b) < 1e-9 for a, b in zip(result["lotes"][0]["consumo_diario_kg"], expected_daily))
+    assert abs(result["consumo_total_kg"] - 2.5) < 1e-9
+    assert abs(result["costo_total"] - 2.5 * 0.6) < 1e-9
+    
+    # Without an explicit list every active lot is planned
+    response = requests.post(f"{API_URL}/feed-calculator/plan", json={"horizonte_dias": 180, "precio_alimento_kg": 0.5})
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 200
+    assert len(response.json()["lotes"]) >= 3
+    assert len(response.json()["consumo_diario_granja_kg"]) == 180
+    
+    print("✅ Feed plan tests passed")
+    return True
+
 def test_financial_transactions():
     print_separator("Testing Financial Transactions")
     
@@ -374,6 +443,458 @@ def test_financial_transactions():
     print("✅ Financial transactions tests passed")
     return True
 
+def test_pagination_and_streaming():
+    print_separator("Testing Pagination and Streaming")
+    
+    # Walk the egg collections page by page following X-Next-Cursor
+    print("\n--- Paginating egg collections ---")
+    seen_ids = []
+    params = {"limit": 1}
+    while True:
+        response = requests.get(f"{API_URL}/egg-collection", params=params)
+        print(f"Status Code: {response.status_code}")
+        
+        assert response.status_code == 200
+        assert len(response.json()) <= 1
+        seen_ids.extend(item["id"] for item in response.json())
+        
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        params = {"limit": 1, "after": next_cursor}
+    
+    print(f"Found {len(seen_ids)} egg collections across pages")
+    assert len(seen_ids) == len(set(seen_ids))
+    assert created_ids["egg_collection_comercial"] in seen_ids
+    assert created_ids["egg_collection_fertil"] in seen_ids
+    
+    # Stream the same collection as NDJSON
+    print("\n--- Streaming egg collections as NDJSON ---")
+    response = requests.get(f"{API_URL}/egg-collection", params={"stream": "true"}, stream=True)
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    streamed_ids = [json.loads(line)["id"] for line in response.iter_lines() if line]
+    print(f"Streamed {len(streamed_ids)} egg collections")
+    assert sorted(streamed_ids) == sorted(seen_ids)
+    
+    # Invalid cursor
+    print("\n--- Testing invalid cursor ---")
+    response = requests.get(f"{API_URL}/egg-collection", params={"after": "not-a-cursor"})
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 400
+    
+    print("✅ Pagination and streaming tests passed")
+    return True
+
+def test_list_filters():
+    print_separator("Testing List Filters")
+    
+    today = date.today().isoformat()
+    params = {"tipo": "ingreso", "desde": today, "hasta": today, "campos": "total,tipo", "orden": "asc"}
+    response = requests.get(f"{API_URL}/transactions", params=params)
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json()[:3], indent=2)}")
+    
+    assert response.status_code == 200
+    rows = response.json()
+    assert rows and all(row["tipo"] == "ingreso" for row in rows)
+    assert all(set(row) == {"id", "fecha", "tipo", "total"} for row in rows)
+    fechas = [row["fecha"] for row in rows]
+    assert fechas == sorted(fechas)
+    
+    # Repeated parameters match any of the values
+    response = requests.get(f"{API_URL}/animals", params=[("tipo", "ponedora"), ("tipo", "engorde")])
+    assert response.status_code == 200
+    assert {animal["tipo"] for animal in response.json()} <= {"ponedora", "engorde"}
+    
+    response = requests.get(f"{API_URL}/egg-collection", params={"campos": "no_existe"})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 400
+    
+    print("✅ List filter tests passed")
+    return True
+
+def test_bulk_ingestion():
+    print_separator("Testing Bulk Ingestion")
+    
+    # JSON array with one invalid record
+    print("\n--- Bulk egg collections (JSON) ---")
+    records = [test_data["egg_collection_comercial"], test_data["egg_collection_fertil"], {"fecha": "no-es-fecha"}]
+    response = requests.post(f"{API_URL}/egg-collection/bulk", json=records)
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    assert response.json()["insertados"] == 2
+    assert [error["indice"] for error in response.json()["errores"]] == [2]
+    
+    # NDJSON upload
+    print("\n--- Bulk egg collections (NDJSON) ---")
+    body = "\n".join(json.dumps(test_data["egg_collection_comercial"]) for _ in range(3)) + "\n"
+    response = requests.post(
+        f"{API_URL}/egg-collection/bulk", data=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    assert response.json()["insertados"] == 3
+    assert response.json()["errores"] == []
+    
+    # CSV upload
+    print("\n--- Bulk transactions (CSV) ---")
+    today = date.today().isoformat()
+    body = (
+        "fecha,tipo,concepto,categoria,cantidad,unidad,precio_unitario,total,observaciones\n"
+        f"{today},ingreso,\"Venta de huevos, bandejas\",Ventas,10,bandejas,3.5,35.0,\n"
+        f"{today},egreso,Compra de alimento,Insumos,,,0.5,no-es-numero,\n"
+    )
+    response = requests.post(f"{API_URL}/transactions/bulk", data=body, headers={"Content-Type": "text/csv"})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    assert response.json()["insertados"] == 1
+    assert [error["indice"] for error in response.json()["errores"]] == [1]
+    
+    # A Latin-1 row fails on its own instead of failing the upload
+    print("\n--- Bulk transactions (CSV with a non-UTF-8 row) ---")
+    body = (
+        b"fecha,tipo,concepto,categoria,cantidad,unidad,precio_unitario,total,observaciones\n"
+        + f"{today},egreso,Compra de maíz,Insumos,,,0.5,20.0,\n".encode("latin-1")
+        + f"{today},egreso,Compra de alimento,Insumos,,,0.5,20.0,\n".encode("utf-8")
+    )
+    response = requests.post(f"{API_URL}/transactions/bulk", data=body, headers={"Content-Type": "text/csv"})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    assert response.json()["insertados"] == 1
+    assert [error["indice"] for error in response.json()["errores"]] == [0]
+    
+    print("✅ Bulk ingestion tests passed")
+    return True
+
+def test_read_cache():
+    print_separator("Testing Read Cache")
+    
+    requests.get(f"{API_URL}/transactions/balance")
+    before = requests.get(f"{API_URL}/admin/cache").json()
+    response = requests.get(f"{API_URL}/transactions/balance")
+    after = requests.get(f"{API_URL}/admin/cache").json()
+    print(f"Cache stats: {after}")
+    
+    assert response.status_code == 200
+    assert after["hits"] > before["hits"]
+    
+    # A new transaction must evict the cached balance
+    print("\n--- Invalidating balance on write ---")
+    cached_balance = response.json()
+    response = requests.post(f"{API_URL}/transactions", json=test_data["transaction_ingreso"])
+    assert response.status_code == 200
+    response = requests.get(f"{API_URL}/transactions/balance")
+    print(f"Response: {response.json()}")
+    
+    assert abs(response.json()["total_ingresos"] - cached_balance["total_ingresos"] - 350.0) < 0.01
+    
+    print("✅ Read cache tests passed")
+    return True
+
+def test_conditional_get():
+    print_separator("Testing Conditional GET")
+    
+    response = requests.get(f"{API_URL}/animals")
+    etag = response.headers.get("ETag")
+    print(f"ETag: {etag}")
+    
+    assert response.status_code == 200
+    assert etag and etag.startswith('W/"')
+    
+    # Unchanged collection answers 304 with no body
+    response = requests.get(f"{API_URL}/animals", headers={"If-None-Match": etag})
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 304
+    assert response.content == b""
+    
+    # Any write bumps the version and therefore the ETag
+    print("\n--- Writing to animals ---")
+    animal_id = created_ids["animal_ponedora"]
+    response = requests.put(f"{API_URL}/animals/{animal_id}", json={"observaciones": "ETag"})
+    assert response.status_code == 200
+    response = requests.get(f"{API_URL}/animals", headers={"If-None-Match": etag})
+    print(f"Status Code: {response.status_code}")
+    print(f"ETag: {response.headers.get('ETag')}")
+    
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    
+    print("✅ Conditional GET tests passed")
+    return True
+
+def test_egg_analytics():
+    print_separator("Testing Egg Analytics")
+    
+    response = requests.get(f"{API_URL}/analytics/eggs", params={"granularidad": "dia", "lote_origen": "Lote-P1"})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    today_points = [
+        point for point in response.json()
+        if point["periodo"].startswith(date.today().isoformat()) and point["tipo"] == "comercial"
+    ]
+    assert len(today_points) == 1
+    point = today_points[0]
+    assert point["cantidad"] >= 80
+    assert point["cerrado"] is False
+    assert abs(point["peso_promedio_huevo"] - point["peso_total"] / point["cantidad"]) < 1e-9
+    # Lote-P1 is an active laying lot, so the per-hen rate is available
+    assert point["gallinas"] >= 1
+    assert point["huevos_por_gallina_dia"] > 0
+    
+    response = requests.get(f"{API_URL}/analytics/eggs", params={"granularidad": "mes"})
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 200
+    assert all(point["periodo"][8:10] == "01" for point in response.json())
+    
+    print("✅ Egg analytics tests passed")
+    return True
+
+def test_search():
+    print_separator("Testing Search")
+    
+    # Full-text search across collections
+    response = requests.get(f"{API_URL}/search", params={"q": "alimento"})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    hits = response.json()
+    assert any(hit["coleccion"] == "transactions" for hit in hits)
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+    
+    # Lot-code autocomplete, case-insensitive
+    response = requests.get(f"{API_URL}/search/lotes", params={"prefix": "lote-"})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.json()}")
+    
+    assert response.status_code == 200
+    assert {"Lote-P1", "Lote-E1", "Lote-R1"} <= set(response.json())
+    
+    print("✅ Search tests passed")
+    return True
+
+def test_lot_summary():
+    print_separator("Testing Lot Summary")
+    
+    # Tie a sale to Lote-P1 so the summary has ledger entries
+    sale = dict(test_data["transaction_ingreso"], lote="Lote-P1")
+    response = requests.post(f"{API_URL}/transactions", json=sale)
+    assert response.status_code == 200
+    
+    response = requests.get(f"{API_URL}/lots/Lote-P1/summary")
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["lote"] == "Lote-P1"
+    assert any(animal["id"] == created_ids["animal_ponedora"] for animal in summary["animales"])
+    assert summary["huevos"]["cantidad"] >= 80
+    assert summary["alimento"]["calculos"] >= 1
+    assert summary["transacciones"]["total_ingresos"] >= 350.0
+    
+    # Unknown lot
+    response = requests.get(f"{API_URL}/lots/{uuid.uuid4()}/summary")
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 404
+    
+    # Paginated list of lots
+    response = requests.get(f"{API_URL}/lots", params={"limit": 1})
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.headers.get("X-Next-Cursor")
+    
+    print("✅ Lot summary tests passed")
+    return True
+
+def test_idempotent_writes():
+    print_separator("Testing Idempotent Writes")
+    
+    key = str(uuid.uuid4())
+    first = requests.post(f"{API_URL}/transactions", json=test_data["transaction_egreso"], headers={"Idempotency-Key": key})
+    retry = requests.post(f"{API_URL}/transactions", json=test_data["transaction_egreso"], headers={"Idempotency-Key": key})
+    print(f"Status Codes: {first.status_code}, {retry.status_code}")
+    
+    assert first.status_code == 200 and retry.status_code == 200
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry.json()["id"] == first.json()["id"]
+    
+    # Same key, different body
+    other = dict(test_data["transaction_egreso"], total=1.0)
+    response = requests.post(f"{API_URL}/transactions", json=other, headers={"Idempotency-Key": key})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 422
+    
+    # Offline queue: re-sending it applies nothing twice
+    mutaciones = [
+        {
+            "id_cliente": str(uuid.uuid4()),
+            "operacion": "crear_recoleccion",
+            "fecha_cliente": datetime.utcnow().isoformat(),
+            "datos": test_data["egg_collection_comercial"],
+        },
+        {
+            "id_cliente": str(uuid.uuid4()),
+            "operacion": "actualizar_animal",
+            "fecha_cliente": (datetime.utcnow() + timedelta(minutes=1)).isoformat(),
+            "objetivo_id": created_ids["animal_ponedora"],
+            "datos": {"observaciones": "Sincronizado"},
+        },
+    ]
+    response = requests.post(f"{API_URL}/sync", json={"mutaciones": mutaciones})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    assert [outcome["estado"] for outcome in response.json()] == ["aplicada", "aplicada"]
+    
+    response = requests.post(f"{API_URL}/sync", json={"mutaciones": mutaciones})
+    assert response.status_code == 200
+    assert [outcome["estado"] for outcome in response.json()] == ["duplicada", "duplicada"]
+    
+    print("✅ Idempotent write tests passed")
+    return True
+
+def test_animal_movements():
+    print_separator("Testing Animal Movements")
+    
+    animal_id = created_ids["animal_engorde"]
+    before = requests.get(f"{API_URL}/animals/{animal_id}").json()
+    
+    response = requests.post(f"{API_URL}/animals/{animal_id}/mortalidad", json={"cantidad": 2})
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    assert response.json()["cantidad"] == before["cantidad"] - 2
+    assert response.json()["bajas"] == before.get("bajas", 0) + 2
+    
+    # More birds than the lot holds
+    response = requests.post(f"{API_URL}/animals/{animal_id}/mortalidad", json={"cantidad": 10**6})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 409
+    
+    # Sales need a replica set for the multi-document transaction
+    response = requests.post(f"{API_URL}/animals/{animal_id}/venta", json={"cantidad": 3, "precio_unitario": 4.0})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code in (200, 503)
+    if response.status_code == 200:
+        sale = response.json()
+        assert sale["animal"]["cantidad"] == before["cantidad"] - 5
+        assert sale["transaccion"]["lote"] == before["lote"]
+        assert sale["transaccion"]["total"] == 12.0
+    
+    print("✅ Animal movement tests passed")
+    return True
+
+def test_export():
+    print_separator("Testing Export")
+    
+    today = date.today().isoformat()
+    response = requests.get(f"{API_URL}/export/transactions", params={"desde": today, "hasta": today}, stream=True)
+    print(f"Status Code: {response.status_code}")
+    
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/csv")
+    lines = [line for line in response.iter_lines(decode_unicode=True) if line]
+    print(f"Rows: {len(lines) - 1}")
+    assert lines[0].startswith("id,farm_id,fecha,tipo")
+    assert any(created_ids["transaction_ingreso"] in line for line in lines[1:])
+    
+    response = requests.get(f"{API_URL}/export/egg_collections", params={"formato": "parquet"})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.content[:4] == b"PAR1"
+    
+    print("✅ Export tests passed")
+    return True
+
+def test_background_jobs():
+    print_separator("Testing Background Jobs")
+    
+    response = requests.get(f"{API_URL}/admin/jobs")
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2, default=str)}")
+    
+    assert response.status_code == 200
+    jobs = response.json()["jobs"]
+    assert {
+        "actualizar_edades", "cerrar_incubaciones_vencidas", "precalentar_dashboard", "archivar_meses_cerrados",
+        "recalcular_kpis",
+    } <= set(jobs)
+    assert all(job["failures"] == 0 for job in jobs.values())
+    
+    print("✅ Background job tests passed")
+    return True
+
+def test_farm_isolation():
+    print_separator("Testing Farm Isolation")
+    
+    other_farm = {"X-Farm-Id": f"granja_{uuid.uuid4().hex[:8]}"}
+    response = requests.post(f"{API_URL}/animals", json=test_data["animal_ponedora"], headers=other_farm)
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()["farm_id"] == other_farm["X-Farm-Id"]
+    
+    # Each farm only sees its own records
+    response = requests.get(f"{API_URL}/animals", headers=other_farm)
+    assert response.status_code == 200
+    assert [animal["id"] for animal in response.json()] == [response.json()[0]["id"]]
+    response = requests.get(f"{API_URL}/animals/{created_ids['animal_ponedora']}", headers=other_farm)
+    assert response.status_code == 404
+    
+    response = requests.get(f"{API_URL}/animals", headers={"X-Farm-Id": "no válida"})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 422
+    
+    print("✅ Farm isolation tests passed")
+    return True
+
+def test_kpis():
+    print_separator("Testing KPIs")
+    
+    response = requests.get(f"{API_URL}/kpis")
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    
+    assert response.status_code == 200
+    report = response.json()
+    lots = {lot["lote"]: lot for lot in report["lotes"]}
+    assert "Lote-E1" in lots
+    assert 0 <= lots["Lote-E1"]["mortalidad"] <= 1
+    # 25-day broiler at 1.2 kg: 14 days at 0.025 kg and 11 at 0.100 kg
+    assert abs(lots["Lote-E1"]["conversion_alimenticia"] - (14 * 0.025 + 11 * 0.100) / 1.2) < 1e-6
+    assert any(breed["raza"] == "Ross 308" for breed in report["razas"])
+    for breed in report["razas"]:
+        stats = breed["mortalidad"]
+        if stats["valor"] is not None:
+            assert stats["p25"] <= stats["p50"] <= stats["p75"]
+            assert 0 <= stats["percentil"] <= 100
+    
+    # Filter by lot
+    response = requests.get(f"{API_URL}/kpis", params={"lote": "Lote-E1"})
+    assert response.status_code == 200
+    assert [lot["lote"] for lot in response.json()["lotes"]] == ["Lote-E1"]
+    
+    print("✅ KPI tests passed")
+    return True
+
 def test_dashboard():
     print_separator("Testing Dashboard")
     
@@ -408,15 +929,70 @@ def test_dashboard():
     print("✅ Dashboard tests passed")
     return True
 
+def test_clean_database():
+    print_separator("Testing Clean Database")
+    
+    # Clean a throwaway farm so the records of the other tests are kept
+    farm = {"X-Farm-Id": f"granja_{uuid.uuid4().hex[:8]}"}
+    sale = dict(test_data["transaction_ingreso"], lote="Lote-P1")
+    response = requests.post(f"{API_URL}/transactions", json=sale, headers=farm)
+    assert response.status_code == 200
+    response = requests.post(f"{API_URL}/egg-collection", json=test_data["egg_collection_comercial"], headers=farm)
+    assert response.status_code == 200
+    response = requests.get(f"{API_URL}/transactions/balance", headers=farm)
+    assert response.json()["balance"] > 0
+    response = requests.get(f"{API_URL}/lots/Lote-P1/summary", headers=farm)
+    assert response.status_code == 200
+    
+    response = requests.delete(f"{API_URL}/admin/clean-database", headers=farm)
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    assert response.json()["total_remaining"] == 0
+    
+    # Rollup-backed reads must not keep the deleted records
+    response = requests.get(f"{API_URL}/transactions/balance", headers=farm)
+    assert response.status_code == 200
+    assert response.json() == {"total_ingresos": 0, "total_egresos": 0, "balance": 0}
+    response = requests.get(f"{API_URL}/dashboard", headers=farm)
+    assert response.status_code == 200
+    dashboard = response.json()
+    assert dashboard["total_animales"] == 0
+    assert dashboard["huevos_hoy"] == 0
+    assert dashboard["huevos_mes"] == 0
+    assert dashboard["balance_mes"] == 0
+    response = requests.get(f"{API_URL}/lots/Lote-P1/summary", headers=farm)
+    assert response.status_code == 404
+    
+    print("✅ Clean database tests passed")
+    return True
+
 def run_all_tests():
     tests = [
         test_health_check,
         test_animals_crud,
         test_incubation_system,
+        test_incubation_telemetry,
         test_egg_collection,
         test_feed_calculator,
+        test_feed_plan,
         test_financial_transactions,
-        test_dashboard
+        test_pagination_and_streaming,
+        test_list_filters,
+        test_bulk_ingestion,
+        test_read_cache,
+        test_conditional_get,
+        test_egg_analytics,
+        test_search,
+        test_lot_summary,
+        test_kpis,
+        test_idempotent_writes,
+        test_animal_movements,
+        test_export,
+        test_background_jobs,
+        test_farm_isolation,
+        test_dashboard,
+        test_clean_database
     ]
     
     results = {}
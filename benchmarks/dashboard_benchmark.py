@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Dashboard latency benchmark: serial queries vs. concurrent $facet pipelines.
+
+Seeds a throwaway database on a local mongod and times the previous
+ten-await implementation of /api/dashboard against `server.compute_dashboard`.
+Every document belongs to the default farm, which the run is scoped to.
+
+    python benchmarks/dashboard_benchmark.py --eggs 200000 --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gallinapp_bench")
+
+import server  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+
+FARM_ID = server.DEFAULT_FARM_ID
+
+
+async def seed(db, animals, eggs, transactions, incubations):
+    for name in ("animals", "egg_collections", "transactions", "incubation_batches"):
+        await db[name].drop()
+    today = datetime.combine(date.today(), datetime.min.time())
+    tipos = ["ponedora", "engorde", "reproductor"]
+
+    await db.animals.insert_many([{
+        "id": str(uuid.uuid4()), "farm_id": FARM_ID, "lote": f"L-{i}", "tipo": random.choice(tipos),
+        "raza": "Isa Brown",
+        "cantidad": random.randint(50, 500), "fecha_ingreso": today - timedelta(days=random.randint(0, 365)),
+        "edad_dias": random.randint(1, 400), "peso_promedio": 1.5,
+        "estado": random.choice(["activo", "activo", "activo", "vendido"]),
+        "created_at": today, "updated_at": today,
+    } for i in range(animals)])
+
+    batch = []
+    for i in range(eggs):
+        batch.append({
+            "id": str(uuid.uuid4()), "farm_id": FARM_ID, "fecha": today - timedelta(days=random.randint(0, 730)),
+            "lote_origen": f"L-{random.randint(0, animals - 1)}", "tipo": random.choice(["comercial", "fertil"]),
+            "cantidad": random.randint(10, 400), "peso_total": 20.0, "created_at": today,
+        })
+        if len(batch) == 10000:
+            await db.egg_collections.insert_many(batch)
+            batch = []
+    if batch:
+        await db.egg_collections.insert_many(batch)
+
+    batch = []
+    for i in range(transactions):
+        batch.append({
+            "id": str(uuid.uuid4()), "farm_id": FARM_ID, "fecha": today - timedelta(days=random.randint(0, 730)),
+            "tipo": random.choice(["ingreso", "egreso"]), "concepto": "Seed", "categoria": "Ventas",
+            "precio_unitario": 1.0, "total": random.uniform(10, 1000), "created_at": today,
+        })
+        if len(batch) == 10000:
+            await db.transactions.insert_many(batch)
+            batch = []
+    if batch:
+        await db.transactions.insert_many(batch)
+
+    await db.incubation_batches.insert_many([{
+        "id": str(uuid.uuid4()), "farm_id": FARM_ID, "lote": f"I-{i}", "tipo_huevo": "ponedora", "raza": "Isa Brown",
+        "cantidad_huevos": 120, "fecha_incubacion": today, "fecha_eclosion_esperada": today + timedelta(days=21),
+        "estado": random.choice(["activo", "eclosionado"]), "pollitos_eclosionados": 0,
+        "created_at": today, "updated_at": today,
+    } for i in range(incubations)])
+
+
+async def legacy_dashboard(db):
+    """The serial implementation /api/dashboard used before the $facet rewrite."""
+    await db.animals.count_documents({"estado": "activo"})
+    await db.animals.count_documents({"tipo": "ponedora", "estado": "activo"})
+    await db.animals.count_documents({"tipo": "engorde", "estado": "activo"})
+    await db.animals.count_documents({"tipo": "reproductor", "estado": "activo"})
+    today = server.date_to_datetime(date.today())
+    start_month, end_month = server.month_bounds(date.today())
+    await db.egg_collections.aggregate([
+        {"$match": {"fecha": today}},
+        {"$group": {"_id": None, "total": {"$sum": "$cantidad"}}},
+    ]).to_list(1)
+    await db.egg_collections.aggregate([
+        {"$match": {"fecha": {"$gte": start_month, "$lte": end_month}}},
+        {"$group": {"_id": None, "total": {"$sum": "$cantidad"}}},
+    ]).to_list(1)
+    await db.incubation_batches.count_documents({"estado": "activo"})
+    await db.transactions.aggregate([
+        {"$match": {"fecha": {"$gte": start_month, "$lte": end_month}}},
+        {"$group": {"_id": "$tipo", "total": {"$sum": "$total"}}},
+    ]).to_list(2)
+    await db.egg_collections.find().sort("fecha", -1).limit(5).to_list(5)
+    await db.animals.find({"tipo": "engorde", "edad_dias": {"$gte": 35}, "estado": "activo"}).limit(5).to_list(5)
+
+
+async def measure(fn, iterations, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fn()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    for _ in range(5):
+        await fn()
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--animals", type=int, default=500)
+    parser.add_argument("--eggs", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=50000)
+    parser.add_argument("--incubations", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    server.db = server.analytics_db = db
+    if not args.skip_seed:
+        await seed(db, args.animals, args.eggs, args.transactions, args.incubations)
+        await server.rebuild_rollups()
+
+    with server.farm_scope(FARM_ID):
+        results = {
+            "seed": vars(args),
+            "before": await measure(lambda: legacy_dashboard(db), args.iterations, args.concurrency),
+            "after": await measure(server.compute_dashboard, args.iterations, args.concurrency),
+        }
+    print(json.dumps(results, indent=2))
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""API load test: throughput, latency percentiles and server RSS per route.
+
+Seeds a throwaway database on a local mongod with synthetic farms, starts the
+API under uvicorn in a child process and drives every route of
+`server.api_router` with concurrent httpx clients, one route at a time and
+then all routes mixed. Results are printed as JSON (and optionally written to
+a file) so runs on different commits can be compared.
+
+    python benchmarks/load_test.py --eggs 1000000 --requests 500 --concurrency 32 --output before.json
+    python benchmarks/load_test.py --skip-seed --requests 500 --concurrency 32 --output after.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gallinapp_load")
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from fastapi.routing import APIRoute  # noqa: E402
+
+SEED_BATCH_SIZE = 10000
+TODAY = datetime.combine(date.today(), datetime.min.time())
+
+# Routes that cannot be driven as request/response load
+SKIPPED_ROUTES = {
+    ("GET", "/api/stream/dashboard"): "conexión SSE de larga duración",
+    ("DELETE", "/api/admin/clean-database"): "destructiva",
+}
+
+
+def lot_code(farm, lot):
+    return f"G{farm}-L{lot}"
+
+
+async def insert_batched(collection, docs):
+    # The load runs without X-Farm-Id, so everything belongs to the default farm
+    batch = []
+    for doc in docs:
+        batch.append({"farm_id": server.DEFAULT_FARM_ID, **doc})
+        if len(batch) == SEED_BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def seed(db, farms, lots, eggs, transactions, feed, incubations):
+    for name in ("animals", "egg_collections", "transactions", "incubation_batches", "feed_calculations"):
+        await db[name].drop()
+    tipos = ["ponedora", "engorde", "reproductor"]
+    lotes = [lot_code(farm, lot) for farm in range(farms) for lot in range(lots)]
+
+    await insert_batched(db.animals, ({
+        "id": str(uuid.uuid4()), "lote": lote, "tipo": random.choice(tipos), "raza": "Isa Brown",
+        "cantidad": random.randint(50, 500), "fecha_ingreso": TODAY - timedelta(days=random.randint(0, 365)),
+        "edad_dias": random.randint(1, 400), "edad_ingreso_dias": random.randint(1, 30), "peso_promedio": 1.5,
+        "estado": random.choice(["activo", "activo", "activo", "vendido"]),
+        "created_at": TODAY, "updated_at": TODAY,
+    } for lote in lotes))
+    await insert_batched(db.egg_collections, ({
+        "id": str(uuid.uuid4()), "fecha": TODAY - timedelta(days=random.randint(0, 730)),
+        "lote_origen": random.choice(lotes), "tipo": random.choice(["comercial", "fertil"]),
+        "cantidad": random.randint(10, 400), "peso_total": 20.0, "created_at": TODAY,
+    } for _ in range(eggs)))
+    await insert_batched(db.transactions, ({
+        "id": str(uuid.uuid4()), "fecha": TODAY - timedelta(days=random.randint(0, 730)),
+        "tipo": random.choice(["ingreso", "egreso"]), "concepto": "Seed", "categoria": "Ventas",
+        "precio_unitario": 1.0, "total": random.uniform(10, 1000), "lote": random.choice(lotes),
+        "created_at": TODAY,
+    } for _ in range(transactions)))
+    await insert_batched(db.feed_calculations, ({
+        "id": str(uuid.uuid4()), "lote": random.choice(lotes), "tipo_animal": random.choice(tipos),
+        "cantidad_animales": 100, "edad_dias": 60, "peso_promedio": 1.5, "consumo_diario_kg": 12.0,
+        "consumo_mensual_kg": 360.0, "costo_estimado": 180.0,
+        "fecha_calculo": TODAY - timedelta(days=random.randint(0, 365)), "created_at": TODAY,
+    } for _ in range(feed)))
+    await insert_batched(db.incubation_batches, ({
+        "id": str(uuid.uuid4()), "lote": f"I-{i}", "tipo_huevo": "ponedora", "raza": "Isa Brown",
+        "cantidad_huevos": 120, "fecha_incubacion": TODAY, "fecha_eclosion_esperada": TODAY + timedelta(days=21),
+        "temperatura": 37.5, "humedad": 60.0, "estado": random.choice(["activo", "eclosionado"]),
+        "pollitos_eclosionados": 0, "created_at": TODAY, "updated_at": TODAY,
+    } for i in range(incubations)))
+
+    await server.ensure_indexes()
+    await server.rebuild_rollups()
+    await server.rebuild_kpis()
+
+
+async def load_context(db, deletions):
+    """Ids and lot codes the scenarios pick from, plus animals reserved for DELETE."""
+    doomed = [{
+        "id": str(uuid.uuid4()), "lote": f"BORRAR-{i}", "tipo": "engorde", "raza": "Ross 308",
+        "cantidad": 1, "fecha_ingreso": TODAY, "edad_dias": 1, "edad_ingreso_dias": 1, "peso_promedio": 0.1,
+        "estado": "vendido", "created_at": TODAY, "updated_at": TODAY,
+    } for i in range(deletions)]
+    await insert_batched(db.animals, doomed)
+    animals = await db.animals.find(
+        {"lote": {"$not": {"$regex": "^BORRAR-"}}}, {"_id": 0, "id": 1, "lote": 1}
+    ).to_list(1000)
+    batches = await db.incubation_batches.find({}, {"_id": 0, "id": 1}).to_list(1000)
+    lotes = await db.animals.distinct("lote", {"lote": {"$not": {"$regex": "^BORRAR-"}}})
+    return {
+        "animal_ids": [doc["id"] for doc in animals],
+        "animal_lots": {doc["id"]: doc["lote"] for doc in animals},
+        "batch_ids": [doc["id"] for doc in batches],
+        "lotes": lotes[:1000],
+        "doomed_ids": [doc["id"] for doc in doomed],
+    }
+
+
+def animal_body(ctx):
+    return {
+        "lote": random.choice(ctx["lotes"]), "tipo": "ponedora", "raza": "Isa Brown", "cantidad": 100,
+        "fecha_ingreso": date.today().isoformat(), "edad_dias": 120, "peso_promedio": 1.8,
+    }
+
+
+def egg_body(ctx):
+    return {
+        "fecha": (date.today() - timedelta(days=random.randint(0, 30))).isoformat(),
+        "lote_origen": random.choice(ctx["lotes"]), "tipo": "comercial", "cantidad": 80, "peso_total": 4.8,
+    }
+
+
+def transaction_body(ctx):
+    return {
+        "fecha": date.today().isoformat(), "tipo": random.choice(["ingreso", "egreso"]), "concepto": "Carga",
+        "categoria": "Ventas", "precio_unitario": 1.0, "total": 25.0, "lote": random.choice(ctx["lotes"]),
+    }
+
+
+def telemetry_body(ctx):
+    # One incubator upload: 100 readings a few seconds apart, a few out of range
+    now = datetime.utcnow()
+    return {"lecturas": [{
+        "ts": (now - timedelta(seconds=5 * i)).isoformat(),
+        "temperatura": round(random.gauss(37.5, 0.3), 2),
+        "humedad": round(random.gauss(60.0, 3.0), 1),
+    } for i in range(100)]}
+
+
+def sync_body(ctx):
+    return {"mutaciones": [{
+        "id_cliente": str(uuid.uuid4()), "operacion": "crear_recoleccion",
+        "fecha_cliente": datetime.utcnow().isoformat(), "datos": egg_body(ctx),
+    } for _ in range(20)]}
+
+
+def transfer(ctx):
+    animal_id = random.choice(ctx["animal_ids"])
+    return {"animal_id": animal_id}, {"json": {"cantidad": 1, "lote_destino": f"{ctx['animal_lots'][animal_id]}-T"}}
+
+
+def pop_doomed(ctx):
+    return {"animal_id": ctx["doomed_ids"].pop()} if ctx["doomed_ids"] else None
+
+
+# (method, path) -> ctx -> (path params, httpx request kwargs); None ends the route early
+SCENARIOS = {
+    ("POST", "/api/animals"): lambda ctx: ({}, {"json": animal_body(ctx)}),
+    ("GET", "/api/animals"): lambda ctx: ({}, {"params": {"limit": 100}}),
+    ("GET", "/api/animals/{animal_id}"): lambda ctx: ({"animal_id": random.choice(ctx["animal_ids"])}, {}),
+    ("PUT", "/api/animals/{animal_id}"): lambda ctx: (
+        {"animal_id": random.choice(ctx["animal_ids"])}, {"json": {"peso_promedio": round(random.uniform(1, 3), 2)}},
+    ),
+    ("DELETE", "/api/animals/{animal_id}"): lambda ctx: (pop_doomed(ctx), {}),
+    ("POST", "/api/animals/{animal_id}/mortalidad"): lambda ctx: (
+        {"animal_id": random.choice(ctx["animal_ids"])}, {"json": {"cantidad": 1}},
+    ),
+    ("POST", "/api/animals/{animal_id}/venta"): lambda ctx: (
+        {"animal_id": random.choice(ctx["animal_ids"])}, {"json": {"cantidad": 1, "precio_unitario": 6.5}},
+    ),
+    ("POST", "/api/animals/{animal_id}/transferencia"): transfer,
+    ("POST", "/api/incubation"): lambda ctx: ({}, {"json": {
+        "lote": f"I-{uuid.uuid4().hex[:8]}", "tipo_huevo": "ponedora", "raza": "Isa Brown", "cantidad_huevos": 120,
+        "fecha_incubacion": date.today().isoformat(),
+        "fecha_eclosion_esperada": (date.today() + timedelta(days=21)).isoformat(),
+    }}),
+    ("GET", "/api/incubation"): lambda ctx: ({}, {"params": {"limit": 100}}),
+    ("POST", "/api/incubation/{batch_id}/telemetry"): lambda ctx: (
+        {"batch_id": random.choice(ctx["batch_ids"])}, {"json": telemetry_body(ctx)},
+    ),
+    ("GET", "/api/incubation/{batch_id}/telemetry"): lambda ctx: (
+        {"batch_id": random.choice(ctx["batch_ids"])}, {"params": {"resolucion": random.choice(["crudo", "1m", "1h"])}},
+    ),
+    ("GET", "/api/incubation/alerts"): lambda ctx: ({}, {"params": {"abiertas": random.choice(["true", "false"])}}),
+    ("PUT", "/api/incubation/{batch_id}"): lambda ctx: (
+        {"batch_id": random.choice(ctx["batch_ids"])}, {"json": {"temperatura": round(random.uniform(37, 38), 1)}},
+    ),
+    ("POST", "/api/egg-collection"): lambda ctx: ({}, {"json": egg_body(ctx)}),
+    ("POST", "/api/egg-collection/bulk"): lambda ctx: ({}, {"json": [egg_body(ctx) for _ in range(100)]}),
+    ("GET", "/api/egg-collection"): lambda ctx: ({}, {"params": {"limit": 100}}),
+    ("GET", "/api/egg-collection/today"): lambda ctx: ({}, {}),
+    ("POST", "/api/feed-calculator"): lambda ctx: ({}, {"json": {
+        "lote": random.choice(ctx["lotes"]), "tipo_animal": "engorde", "cantidad_animales": 200,
+        "edad_dias": 25, "peso_promedio": 1.2, "precio_alimento_kg": 0.55,
+    }}),
+    ("GET", "/api/feed-calculator"): lambda ctx: ({}, {"params": {"limit": 100}}),
+    ("POST", "/api/feed-calculator/plan"): lambda ctx: ({}, {"json": {"horizonte_dias": 90, "precio_alimento_kg": 0.55}}),
+    ("POST", "/api/transactions"): lambda ctx: ({}, {"json": transaction_body(ctx)}),
+    ("POST", "/api/transactions/bulk"): lambda ctx: ({}, {"json": [transaction_body(ctx) for _ in range(100)]}),
+    ("GET", "/api/transactions"): lambda ctx: ({}, {"params": {"limit": 100}}),
+    ("GET", "/api/transactions/balance"): lambda ctx: ({}, {}),
+    ("POST", "/api/sync"): lambda ctx: ({}, {"json": sync_body(ctx)}),
+    ("GET", "/api/dashboard"): lambda ctx: ({}, {}),
+    ("GET", "/api/analytics/eggs"): lambda ctx: ({}, {"params": {"granularidad": random.choice(["dia", "semana", "mes"])}}),
+    ("GET", "/api/search"): lambda ctx: ({}, {"params": {"q": random.choice(ctx["lotes"])}}),
+    ("GET", "/api/search/lotes"): lambda ctx: ({}, {"params": {"prefix": random.choice(ctx["lotes"])[:3]}}),
+    ("GET", "/api/lots"): lambda ctx: ({}, {"params": {"limit": 50}}),
+    ("GET", "/api/lots/{lote}/summary"): lambda ctx: ({"lote": random.choice(ctx["lotes"])}, {}),
+    ("GET", "/api/kpis"): lambda ctx: ({}, {}),
+    ("GET", "/api/export/{coleccion}"): lambda ctx: (
+        {"coleccion": random.choice(["egg_collections", "transactions"])},
+        {"params": {"desde": (date.today() - timedelta(days=7)).isoformat()}},
+    ),
+    ("GET", "/api/health"): lambda ctx: ({}, {}),
+    ("GET", "/api/admin/indexes/explain"): lambda ctx: ({}, {}),
+    ("GET", "/api/admin/cache"): lambda ctx: ({}, {}),
+    ("GET", "/api/admin/jobs"): lambda ctx: ({}, {}),
+}
+
+
+def api_routes():
+    for route in server.api_router.routes:
+        if isinstance(route, APIRoute):
+            for method in sorted(route.methods):
+                yield method, route.path
+
+
+def percentile(latencies, q):
+    return latencies[max(0, math.ceil(q * len(latencies)) - 1)]
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    latencies.sort()
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    if latencies:
+        result.update({
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+        })
+    return result
+
+
+async def drive(http, ctx, routes, requests, concurrency):
+    """Send `requests` requests spread over `routes` from `concurrency` workers."""
+    latencies, statuses = [], {}
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, path = random.choice(routes)
+            scenario = SCENARIOS[(method, path)](ctx)
+            path_params, kwargs = scenario
+            if path_params is None:
+                return
+            started = time.perf_counter()
+            try:
+                response = await http.request(method, path.format(**path_params), **kwargs)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+class RssSampler:
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+
+    async def run(self):
+        while True:
+            self.peak = max(self.peak, rss_mb(self.pid) or 0.0)
+            await asyncio.sleep(self.interval)
+
+
+def start_server(port):
+    env = dict(os.environ, JOBS_ENABLED="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def wait_ready(http, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            if (await http.get("/api/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("server did not become ready")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--farms", type=int, default=10)
+    parser.add_argument("--lots", type=int, default=20, help="lotes por granja")
+    parser.add_argument("--eggs", type=int, default=10000, help="recolecciones de huevos (10k a 10M)")
+    parser.add_argument("--transactions", type=int, default=None, help="por defecto, eggs / 2")
+    parser.add_argument("--feed", type=int, default=None, help="por defecto, eggs / 10")
+    parser.add_argument("--incubations", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por ruta")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    transactions = args.transactions if args.transactions is not None else args.eggs // 2
+    feed = args.feed if args.feed is not None else args.eggs // 10
+
+    db = server.db
+    if not args.skip_seed:
+        started = time.perf_counter()
+        await seed(db, args.farms, args.lots, args.eggs, transactions, feed, args.incubations)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    ctx = await load_context(db, args.requests)
+
+    routes = list(api_routes())
+    driven = [route for route in routes if route in SCENARIOS]
+    skipped = {f"{method} {path}": SKIPPED_ROUTES.get((method, path), "sin escenario")
+               for method, path in routes if (method, path) not in SCENARIOS}
+
+    process = start_server(args.port)
+    results = {
+        "commit": git_commit(),
+        "seed": {"farms": args.farms, "lots_per_farm": args.lots, "eggs": args.eggs,
+                 "transactions": transactions, "feed": feed, "incubations": args.incubations},
+        "load": {"requests_per_route": args.requests, "concurrency": args.concurrency},
+        "routes": {},
+        "skipped": skipped,
+    }
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60) as http:
+            await wait_ready(http, process)
+            sampler = RssSampler(process.pid)
+            sampler_task = asyncio.create_task(sampler.run())
+            rss_start = rss_mb(process.pid)
+            for route in driven:
+                method, path = route
+                results["routes"][f"{method} {path}"] = await drive(http, ctx, [route], args.requests, args.concurrency)
+                print(f"{method} {path}: {results['routes'][f'{method} {path}']['throughput_rps']} req/s",
+                      file=sys.stderr)
+            # DELETE has used up its reserved animals, so the mixed phase leaves it out
+            mixed = [route for route in driven if route[0] != "DELETE"]
+            results["mixed"] = await drive(http, ctx, mixed, args.requests * len(mixed), args.concurrency)
+            sampler_task.cancel()
+            results["server_rss_mb"] = {
+                "start": round(rss_start, 1),
+                "peak": round(sampler.peak, 1),
+                "end": round(rss_mb(process.pid), 1),
+            }
+    finally:
+        process.terminate()
+        process.wait()
+        server.client.close()
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        args.output.write_text(report + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
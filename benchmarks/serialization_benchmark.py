@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Serialization micro-benchmark for list responses.
+
+Compares the previous read path (build an EggCollection per document, then let
+FastAPI validate and serialize the list through response_model) against the
+fast path used by list_documents (encode the projected documents directly).
+No database is needed: documents are generated in memory.
+
+    python benchmarks/serialization_benchmark.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gallinapp_bench")
+
+import server  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+
+def make_docs(count):
+    now = datetime(2024, 1, 1)
+    return [{
+        "id": str(uuid.uuid4()),
+        "fecha": now - timedelta(days=i % 730),
+        "lote_origen": f"L-{i % 50}",
+        "tipo": "comercial" if i % 3 else "fertil",
+        "cantidad": 100 + i % 300,
+        "peso_total": 6.25,
+        "observaciones": None,
+        "created_at": now,
+    } for i in range(count)]
+
+
+async def model_path(docs, field):
+    models = [server.EggCollection(**doc) for doc in docs]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+
+async def fast_path(docs, field):
+    return server.json_response(docs).body
+
+
+async def measure(fn, docs, field, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn(docs, field)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    field = create_response_field(name="response", type_=List[server.EggCollection])
+    results = {"encoder": "orjson" if server.orjson is not None else "json", "sizes": {}}
+    for size in args.sizes:
+        docs = make_docs(size)
+        before = await measure(model_path, docs, field, args.repeat)
+        after = await measure(fast_path, docs, field, args.repeat)
+        results["sizes"][size] = {
+            "before_docs_per_sec": round(size / before),
+            "after_docs_per_sec": round(size / after),
+            "speedup": round(before / after, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,6 +13,18 @@ function App() {
 
   useEffect(() => {
     fetchDashboardData();
+
+    // Recibir los cambios del dashboard en vivo en lugar de volver a consultarlo
+    const source = new EventSource(`${API}/stream/dashboard`);
+    source.addEventListener('snapshot', (event) => {
+      setDashboardData(JSON.parse(event.data));
+      setLoading(false);
+    });
+    source.addEventListener('delta', (event) => {
+      const delta = JSON.parse(event.data);
+      setDashboardData((current) => ({ ...current, ...delta }));
+    });
+    return () => source.close();
   }, []);
 
   const fetchDashboardData = async () => {
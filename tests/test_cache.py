@@ -0,0 +1,77 @@
+"""RedisCache against an in-process Redis stand-in (fakeredis)."""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gallinapp_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def make_cache(ttl=60):
+    cache = server.RedisCache("redis://localhost:6379/0", ttl)
+    cache.redis = fakeredis.aioredis.FakeRedis()
+    return cache
+
+
+def test_get_returns_what_set_stored():
+    async def scenario():
+        cache = make_cache()
+        assert await cache.get("balance") is None
+        await cache.set("balance", b'{"balance":5.0}', ["transactions"])
+        assert await cache.get("balance") == b'{"balance":5.0}'
+        assert await cache.redis.pttl(cache.prefix + "balance") > 0
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_deletes_only_the_tagged_entries():
+    async def scenario():
+        cache = make_cache()
+        await cache.set("balance", b"1", ["transactions"])
+        await cache.set("dashboard", b"2", ["transactions", "animals"])
+        await cache.set("animals", b"3", ["animals"])
+
+        await cache.invalidate(["transactions"])
+
+        assert await cache.get("balance") is None
+        assert await cache.get("dashboard") is None
+        assert await cache.get("animals") == b"3"
+        assert not await cache.redis.exists(cache.prefix + "tag:transactions")
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_unknown_tag_is_a_no_op():
+    async def scenario():
+        cache = make_cache()
+        await cache.set("balance", b"1", ["transactions"])
+        await cache.invalidate(["egg_collections"])
+        assert await cache.get("balance") == b"1"
+
+    asyncio.run(scenario())
+
+
+def test_farm_scoped_tags_do_not_cross_farms():
+    async def scenario():
+        server.cache, previous = make_cache(), server.cache
+        try:
+            with server.farm_scope("granja_a"):
+                await server.cache.set(server.cache_key("balance", {}), b"a", [server.farm_scoped("transactions")])
+            with server.farm_scope("granja_b"):
+                await server.cache.set(server.cache_key("balance", {}), b"b", [server.farm_scoped("transactions")])
+                await server.invalidate_cache("transactions")
+                assert await server.cache.get(server.cache_key("balance", {})) is None
+            with server.farm_scope("granja_a"):
+                assert await server.cache.get(server.cache_key("balance", {})) == b"a"
+        finally:
+            server.cache = previous
+
+    asyncio.run(scenario())
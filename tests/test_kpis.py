@@ -0,0 +1,24 @@
+"""Feed conversion used by the lot KPIs."""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gallinapp_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def test_lifetime_consumption_sums_each_day_at_its_band_rate():
+    bands = server.FEED_CONSUMPTION_TABLE[server.AnimalType.PONEDORA]
+    # 42 days at 0.030 kg, then days 42..49 at 0.080 kg
+    assert server.lifetime_consumption(bands, 50) == pytest.approx(42 * 0.030 + 8 * 0.080)
+    assert server.lifetime_consumption(bands, 50) / 1.2 == pytest.approx(1.5833, abs=1e-4)
+
+
+def test_lifetime_consumption_of_a_new_bird_is_zero():
+    bands = server.FEED_CONSUMPTION_TABLE[server.AnimalType.ENGORDE]
+    assert server.lifetime_consumption(bands, 0) == 0.0